@@ -0,0 +1,148 @@
+import numpy as np
+
+class Bin:
+    """A labelled interval of one column; closed is "left", "right", "both" or "neither"."""
+
+    def __init__(self, label, lo=-np.inf, hi=np.inf, closed="left"):
+        self.label = label
+        self.lo = lo
+        self.hi = hi
+        self.closed = closed
+
+    def mask(self, values):
+        lower = values >= self.lo if self.closed in ("left", "both") else values > self.lo
+        upper = values <= self.hi if self.closed in ("right", "both") else values < self.hi
+        return lower & upper
+
+def value_bins(values, label="{}"):
+    """One closed bin per exact value, e.g. trip lengths."""
+    return [Bin(label.format(v), v, v, "both") for v in values]
+
+class Grouping:
+    """Bins over one column. Bins should not overlap; rows outside every bin are left out."""
+
+    def __init__(self, column, bins):
+        self.column = column
+        self.bins = bins
+
+    def group_ids(self, columns):
+        """Group index of every row, -1 for rows in no bin."""
+        values = columns[self.column]
+        ids = np.full(len(values), -1, dtype=np.int64)
+        for i, b in enumerate(self.bins):
+            ids[b.mask(values)] = i
+        return ids
+
+def case_columns(cases, actuals=None):
+    """Columns a Grouping can refer to: days, miles, receipts, miles_per_day, expected, and actual/error."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        miles_per_day = np.where(cases.days > 0, cases.miles / cases.days, 0)
+    columns = {
+        "days": cases.days,
+        "miles": cases.miles,
+        "receipts": cases.receipts,
+        "miles_per_day": miles_per_day,
+        "expected": cases.expected,
+    }
+    if actuals is not None:
+        columns["actual"] = actuals
+        columns["error"] = np.abs(actuals - cases.expected)
+    return columns
+
+def _group_quantiles(ids, values, k, quantiles, value_order=None):
+    """Linear-interpolated quantiles of values per group.
+
+    value_order (argsort of values) can be shared between groupings; each
+    grouping then only needs a stable sort of its small-integer ids.
+    """
+    if value_order is None:
+        value_order = np.argsort(values, kind="stable")
+    group_of = ids[value_order]
+    if k < 2 ** 15:
+        group_of = group_of.astype(np.int16)
+    by_group = np.argsort(group_of, kind="stable")
+    # Rows in no group (-1) sort first; skip past them
+    skipped = int((ids < 0).sum())
+    sorted_values = values[value_order[by_group[skipped:]]]
+    ids = ids[ids >= 0]
+    counts = np.bincount(ids, minlength=k)
+    if not len(sorted_values):
+        return {q: np.full(k, np.nan) for q in quantiles}
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    last = np.minimum(starts + np.maximum(counts - 1, 0), len(sorted_values) - 1)
+    result = {}
+    for q in quantiles:
+        pos = np.minimum(starts + q * np.maximum(counts - 1, 0), last)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        below, above = sorted_values[lo], sorted_values[hi]
+        result[q] = np.where(counts > 0, below + (above - below) * (pos - lo), np.nan)
+    return result
+
+def group_stats(ids, k, values, quantiles=(), errors=None, close=1.0, exact=0.01, value_order=None):
+    """Count, first row, mean/min/max/quantiles of values, and error statistics for k groups."""
+    keep = ids >= 0
+    kept = ids[keep]
+    counts = np.bincount(kept, minlength=k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = {
+            "count": counts,
+            "mean": np.bincount(kept, weights=values[keep], minlength=k) / counts,
+            "min": np.full(k, np.inf),
+            "max": np.full(k, -np.inf),
+            "first": np.full(k, len(ids), dtype=np.int64),
+        }
+    np.minimum.at(stats["min"], kept, values[keep])
+    np.maximum.at(stats["max"], kept, values[keep])
+    np.minimum.at(stats["first"], kept, np.flatnonzero(keep))
+    empty = counts == 0
+    stats["min"][empty] = stats["max"][empty] = np.nan
+    stats["first"][empty] = -1
+    if quantiles:
+        for q, qv in _group_quantiles(ids, values, k, quantiles, value_order).items():
+            stats[f"q{q * 100:g}"] = qv
+    if errors is not None:
+        err = errors[keep]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats["error_mean"] = np.bincount(kept, weights=err, minlength=k) / counts
+        stats["error_max"] = np.full(k, -np.inf)
+        np.maximum.at(stats["error_max"], kept, err)
+        stats["error_max"][empty] = np.nan
+        stats["exact_matches"] = np.bincount(kept, weights=err < exact, minlength=k).astype(np.int64)
+        stats["close_matches"] = np.bincount(kept, weights=err < close, minlength=k).astype(np.int64)
+    return stats
+
+def aggregate(columns, groupings, value="expected", quantiles=(0.5,)):
+    """Statistics of `value` for every bin of every grouping.
+
+    Returns {name: [row dict per bin]} with label, count, first, mean, min,
+    max, one qNN entry per quantile, and error_mean/error_max/exact_matches/
+    close_matches when columns include "error".
+    """
+    values = np.asarray(columns[value], dtype=np.float64)
+    errors = columns.get("error")
+    value_order = np.argsort(values, kind="stable") if quantiles else None
+    report = {}
+    for name, grouping in groupings.items():
+        k = len(grouping.bins)
+        stats = group_stats(grouping.group_ids(columns), k, values, quantiles, errors, value_order=value_order)
+        report[name] = [dict({key: column[i].item() for key, column in stats.items()}, label=b.label)
+                        for i, b in enumerate(grouping.bins)]
+    return report
+
+def top_k(values, k):
+    """Indices of the k largest values, largest first, ties broken by the later index first.
+
+    Uses a partial selection, so only the candidates are sorted.
+    """
+    values = np.asarray(values)
+    if k <= 0 or not len(values):
+        return np.zeros(0, dtype=np.int64)
+    if k < len(values):
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        # Keep every value tied with the threshold so the tie-break stays exact
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    order = np.lexsort((candidates, values[candidates]))[::-1]
+    return candidates[order][:k]
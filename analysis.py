@@ -1,75 +1,70 @@
-import json
-from run import calculate_reimbursement
+import numpy as np
+
+from aggregate import Bin, Grouping, aggregate, case_columns, top_k, value_bins
+from cases import load_cases, plain_number
+from run import calculate_reimbursement, calculate_reimbursement_batch
+
+# Breakdowns of the public cases, all computed in one pass by aggregate()
+PATTERN_GROUPS = {
+    "trip_length": Grouping("days", value_bins([5, 4, 6], "{}-day trips")),
+    "mileage": Grouping("miles", [
+        Bin("Low mileage (≤150)", hi=150, closed="right"),
+        Bin("High mileage (>150)", lo=150, closed="neither"),
+    ]),
+    "receipts": Grouping("receipts", [
+        Bin("Very low (<50)", hi=50, closed="neither"),
+        Bin("Low (50-600)", 50, 600, closed="left"),
+        Bin("Sweet spot (600-800)", 600, 800, closed="both"),
+        Bin("High (>800)", lo=800, closed="neither"),
+    ]),
+    "efficiency": Grouping("miles_per_day", [
+        Bin("Cases in efficiency sweet spot (180-220 mpd)", 180, 220, closed="both"),
+    ]),
+}
 
 def analyze_patterns():
     """Analyze patterns in the public test cases to understand the system better."""
     
-    with open("public_cases.json") as f:
-        cases = json.load(f)
+    cases = load_cases("public_cases.json")
+    days, expected = cases.days, cases.expected
+    groups = aggregate(case_columns(cases), PATTERN_GROUPS)
     
     print("🔍 Analyzing Legacy System Patterns")
     print("=" * 50)
     
     # Analyze per diem patterns
     print("\n📊 Per Diem Analysis:")
-    per_diem_cases = []
-    for case in cases[:20]:  # Sample first 20 cases
-        d = case["input"]["trip_duration_days"]
-        expected = case["expected_output"]
-        per_diem_cases.append((d, expected))
-        print(f"  {d} days → ${expected:.2f}")
+    for d, e in zip(days[:20].tolist(), expected[:20].tolist()):  # Sample first 20 cases
+        print(f"  {d} days → ${e:.2f}")
     
     # Analyze 5-day trip bonus
     print("\n🎯 5-Day Trip Bonus Analysis:")
-    five_day_cases = [c for c in cases if c["input"]["trip_duration_days"] == 5]
-    four_day_cases = [c for c in cases if c["input"]["trip_duration_days"] == 4]
-    six_day_cases = [c for c in cases if c["input"]["trip_duration_days"] == 6]
+    five_day, four_day, six_day = groups["trip_length"]
     
-    print(f"  5-day trips: {len(five_day_cases)} cases")
-    print(f"  4-day trips: {len(four_day_cases)} cases")  
-    print(f"  6-day trips: {len(six_day_cases)} cases")
+    for group in groups["trip_length"]:
+        print(f"  {group['label']}: {group['count']} cases")
     
     # Sample comparisons
-    if five_day_cases and four_day_cases:
-        print(f"  Sample 5-day: ${five_day_cases[0]['expected_output']:.2f}")
-        print(f"  Sample 4-day: ${four_day_cases[0]['expected_output']:.2f}")
+    if five_day["count"] and four_day["count"]:
+        print(f"  Sample 5-day: ${expected[five_day['first']]:.2f}")
+        print(f"  Sample 4-day: ${expected[four_day['first']]:.2f}")
     
     # Analyze mileage patterns
     print("\n🚗 Mileage Analysis:")
-    low_mile_cases = [c for c in cases if c["input"]["miles_traveled"] <= 150]
-    high_mile_cases = [c for c in cases if c["input"]["miles_traveled"] > 150]
-    
-    print(f"  Low mileage (≤150): {len(low_mile_cases)} cases")
-    print(f"  High mileage (>150): {len(high_mile_cases)} cases")
+    for group in groups["mileage"]:
+        print(f"  {group['label']}: {group['count']} cases")
     
     # Analyze receipt patterns
     print("\n🧾 Receipt Analysis:")
-    receipt_ranges = [
-        ("Very low (<50)", [c for c in cases if c["input"]["total_receipts_amount"] < 50]),
-        ("Low (50-600)", [c for c in cases if 50 <= c["input"]["total_receipts_amount"] < 600]),
-        ("Sweet spot (600-800)", [c for c in cases if 600 <= c["input"]["total_receipts_amount"] <= 800]),
-        ("High (>800)", [c for c in cases if c["input"]["total_receipts_amount"] > 800])
-    ]
-    
-    for range_name, range_cases in receipt_ranges:
-        print(f"  {range_name}: {len(range_cases)} cases")
-        if range_cases:
-            avg_reimbursement = sum(c["expected_output"] for c in range_cases) / len(range_cases)
-            print(f"    Average reimbursement: ${avg_reimbursement:.2f}")
+    for group in groups["receipts"]:
+        print(f"  {group['label']}: {group['count']} cases")
+        if group["count"]:
+            print(f"    Average reimbursement: ${group['mean']:.2f}")
     
     # Analyze efficiency patterns
     print("\n⚡ Efficiency Analysis:")
-    efficiency_cases = []
-    for case in cases:
-        d = case["input"]["trip_duration_days"]
-        m = case["input"]["miles_traveled"]
-        mpd = m / d if d > 0 else 0
-        efficiency_cases.append((mpd, case["expected_output"]))
-    
-    # Find cases in the "sweet spot"
-    sweet_spot_cases = [c for c in cases 
-                       if 180 <= (c["input"]["miles_traveled"] / c["input"]["trip_duration_days"]) <= 220]
-    print(f"  Cases in efficiency sweet spot (180-220 mpd): {len(sweet_spot_cases)}")
+    for group in groups["efficiency"]:
+        print(f"  {group['label']}: {group['count']}")
 
 def test_specific_cases():
     """Test specific cases that might reveal patterns."""
@@ -105,27 +100,21 @@ def test_specific_cases():
 def find_worst_errors():
     """Find the cases with the highest errors to debug."""
     
-    with open("public_cases.json") as f:
-        cases = json.load(f)
+    cases = load_cases("public_cases.json")
     
     print("\n❌ Worst Error Cases")
     print("=" * 20)
     
-    errors = []
-    for i, case in enumerate(cases):
-        d = case["input"]["trip_duration_days"]
-        m = case["input"]["miles_traveled"]
-        r = case["input"]["total_receipts_amount"]
-        expected = case["expected_output"]
-        actual = calculate_reimbursement(d, m, r)
-        error = abs(actual - expected)
-        
-        errors.append((error, i, d, m, r, expected, actual))
+    actuals = calculate_reimbursement_batch(*cases.columns())
+    errors = np.abs(actuals - cases.expected)
     
-    # Sort by error and show top 10
-    errors.sort(reverse=True)
+    # Top 10 by error (ties by latest case first), without sorting every case
+    order = top_k(errors, 10)
     
-    for error, case_num, days, miles, receipts, expected, actual in errors[:10]:
+    for case_num in order.tolist():
+        error, expected, actual = errors[case_num], cases.expected[case_num], actuals[case_num]
+        days, miles, receipts = (plain_number(cases.days[case_num].item()), plain_number(cases.miles[case_num].item()),
+                                 cases.receipts[case_num])
         mpd = miles / days if days > 0 else 0
         print(f"  Case {case_num + 1}: Error ${error:.2f}")
         print(f"    Input: {days}d, {miles}mi, ${receipts:.2f}")
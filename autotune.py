@@ -1,66 +1,186 @@
+import argparse
 import json
 import itertools
-from run import calculate_reimbursement
-import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import profiling
+from cases import load_cases
+from run import DEFAULT_PARAMS, rule_based_batch
+
+# Cap on candidates x cases evaluated in one array operation
+MAX_CELLS = 4_000_000
+
+_cases = None
 
 def load_public_cases():
-    with open("public_cases.json") as f:
-        return json.load(f)
+    return load_cases("public_cases.json")
+
+def case_arrays(cases):
+    return (cases.days.astype(np.float64), cases.miles, cases.receipts, cases.expected)
+
+def _init_worker(arrays):
+    global _cases
+    _cases = arrays
+
+def score_candidates(candidates, arrays=None):
+    """Total absolute error of the rule fallback for each candidate parameter set."""
+    days, miles, receipts, expected = arrays if arrays is not None else _cases
+    names = list(DEFAULT_PARAMS)
+    step = max(1, MAX_CELLS // max(len(days), 1))
+    totals = []
+    for lo in range(0, len(candidates), step):
+        batch = candidates[lo:lo + step]
+        params = {name: np.array([c[name] for c in batch], dtype=np.float64)[:, None] for name in names}
+        actual = rule_based_batch(days, miles, receipts, params)
+        totals.append(np.abs(actual - expected).sum(axis=1))
+    return np.concatenate(totals) if totals else np.zeros(0)
+
+class Scorer:
+    """Scores candidate batches against every case, split across worker processes."""
+
+    def __init__(self, arrays, jobs=1):
+        self.arrays = arrays
+        self.jobs = jobs
+        self.scored = 0
+        self.pool = None
+        if jobs > 1:
+            self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(arrays,))
+
+    def __call__(self, candidates):
+        self.scored += len(candidates)
+        if self.pool is None or len(candidates) < 2:
+            return score_candidates(candidates, self.arrays)
+        bounds = np.linspace(0, len(candidates), min(self.jobs, len(candidates)) + 1).astype(int)
+        parts = [candidates[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return np.concatenate(list(self.pool.map(score_candidates, parts)))
 
-def evaluate_case(trip_days, miles, receipts, expected):
-    actual = calculate_reimbursement(trip_days, miles, receipts)
-    return abs(actual - expected)
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+def initial_steps(params):
+    return {name: max(abs(value) * 0.1, 0.01) for name, value in params.items()}
+
+def grid_search(score, base_params, grid):
+    names = list(grid)
+    candidates = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        current_params = dict(base_params)
+        current_params.update(zip(names, values))
+        candidates.append(current_params)
+    errors = score(candidates)
+    best = int(np.argmin(errors))
+    return candidates[best], float(errors[best])
+
+def coordinate_search(score, base_params, rounds=50, patience=3, tol=1e-6):
+    """Pattern search: try moving every parameter by +-k steps at once, keep the best move.
+
+    Steps are halved after a round without improvement; the search stops after
+    `patience` consecutive halvings without progress or after `rounds` rounds.
+    """
+    best_params = dict(base_params)
+    best_error = float(score([best_params])[0])
+    steps = initial_steps(best_params)
+    stalled = 0
+    for round_num in range(rounds):
+        candidates = []
+        for name in best_params:
+            for k in (-4, -2, -1, 1, 2, 4):
+                candidate = dict(best_params)
+                candidate[name] = best_params[name] + k * steps[name]
+                candidates.append(candidate)
+        errors = score(candidates)
+        i = int(np.argmin(errors))
+        if errors[i] < best_error - tol:
+            best_error, best_params = float(errors[i]), candidates[i]
+            stalled = 0
+            print(f"New best error: {best_error:.2f} (round {round_num + 1})")
+        else:
+            steps = {name: step / 2 for name, step in steps.items()}
+            stalled += 1
+            if stalled >= patience:
+                break
+    return best_params, best_error
+
+def random_search(score, base_params, samples=256, batches=40, patience=5, seed=0):
+    """Gaussian perturbations around the current best; stop after `patience` batches without improvement."""
+    rng = np.random.default_rng(seed)
+    best_params = dict(base_params)
+    best_error = float(score([best_params])[0])
+    steps = initial_steps(best_params)
+    stalled = 0
+    for batch_num in range(batches):
+        candidates = [{name: value + rng.normal() * steps[name] for name, value in best_params.items()}
+                      for _ in range(samples)]
+        errors = score(candidates)
+        i = int(np.argmin(errors))
+        if errors[i] < best_error:
+            best_error, best_params = float(errors[i]), candidates[i]
+            stalled = 0
+            print(f"New best error: {best_error:.2f} (batch {batch_num + 1})")
+        else:
+            stalled += 1
+            if stalled >= patience:
+                break
+    return best_params, best_error
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the rule-based fallback parameters against the public cases.")
+    parser.add_argument("--strategy", choices=["coordinate", "random", "grid"], default="coordinate")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--rounds", type=int, default=50, help="max rounds (coordinate) or batches (random)")
+    parser.add_argument("--patience", type=int, default=3, help="rounds without improvement before stopping")
+    parser.add_argument("--samples", type=int, default=256, help="candidates per batch (random)")
+    parser.add_argument("--save", metavar="PATH", help="write the best params as JSON")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.start(args.profile, args.profile_trace, "autotune.py")
+    try:
+        tune(args)
+    finally:
+        if args.profile:
+            profiling.finish()
+
+def tune(args):
+    with profiling.phase("parse cases") as parsed:
+        cases = load_public_cases()
+        arrays = case_arrays(cases)
+        parsed.rows = len(cases)
 
-def main():
-    cases = load_public_cases()
-    
     # We'll modify these parameters in our tuning
-    base_params = {
-        'per_diem': 100,
-        'bonus_5day': 50,
-        'mileage_rate_under': 0.58,
-        'mileage_rate_over': 0.10,
-        'receipt_low_mult': 0.25,
-        'receipt_mid_mult': 0.85,
-        'receipt_mid_bonus': 25,
-        'receipt_high_mult': 0.12,
-        'receipt_default_mult': 0.65,
-        'receipt_cap': 700,
-        'efficiency_bonus': 45,
-        'efficiency_low': 175,
-        'efficiency_high': 225,
-        'rounding_bonus': 0.03
-    }
-    
-    best_error = float('inf')
-    best_params = base_params
-    
-    # Test different parameter combinations
-    for per_diem in [95, 100, 105]:
-        for bonus in [40, 50, 60]:
-            current_params = copy.deepcopy(base_params)
-            current_params['per_diem'] = per_diem
-            current_params['bonus_5day'] = bonus
-            
-            total_error = 0
-            for case in cases[:100]:  # Test on subset for speed
-                error = evaluate_case(
-                    case["input"]["trip_duration_days"],
-                    case["input"]["miles_traveled"],
-                    case["input"]["total_receipts_amount"],
-                    case["expected_output"]
-                )
-                total_error += error
-            
-            if total_error < best_error:
-                best_error = total_error
-                best_params = current_params
-                print(f"New best error: {best_error:.2f}")
-                print(f"Params: per_diem={per_diem}, bonus={bonus}")
+    base_params = dict(DEFAULT_PARAMS)
+
+    score = Scorer(arrays, args.jobs)
+    try:
+        # Rows are candidate x case evaluations
+        with profiling.phase("search") as search:
+            if args.strategy == "grid":
+                # Test different parameter combinations
+                best_params, best_error = grid_search(score, base_params, {
+                    "per_diem": [95, 100, 105],
+                    "bonus_5day": [40, 50, 60],
+                })
+            elif args.strategy == "random":
+                best_params, best_error = random_search(score, base_params, args.samples, args.rounds, args.patience)
+            else:
+                best_params, best_error = coordinate_search(score, base_params, args.rounds, args.patience)
+            search.rows = score.scored * len(cases)
+    finally:
+        with profiling.phase("stop workers"):
+            score.close()
 
     print("\n🏆 Best params found:")
     print(best_params)
-    print(f"Total error: {best_error:.2f}")
+    print(f"Total error: {best_error:.2f} over {len(cases)} cases (rule fallback only)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(best_params, f, indent=2)
+        print(f"✅ Saved to {args.save}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_SIZES = "1000,100000,10000000"
+DEFAULT_STARTUP_ROWS = 1_000_000
+# What a one-shot `python run.py 5 250 150.75` does: the tables load lazily, so importing alone isn't enough
+RUN_ONE = "import run; run.calculate_reimbursement(5, 250, 150.75)"
+
+def time_per_call(fn, inputs, repeats, reset=None):
+    """Median over repeats of the mean seconds per call across inputs; reset runs untimed before each repeat."""
+    timings = []
+    for _ in range(repeats):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        for args in inputs:
+            fn(*args)
+        timings.append((time.perf_counter() - start) / len(inputs))
+    return statistics.median(timings)
+
+def time_run(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def resolution_path(trip_days, miles, receipts):
+    """Which branch of calculate_reimbursement answers this input: exact, pattern or rules."""
+    import run
+    return run.resolve_reimbursement(trip_days, miles, receipts)[1].split("_")[0]
+
+def path_samples(per_path=2000, seed=0):
+    """Inputs grouped by the branch that resolves them."""
+    from cases import load_cases
+
+    cases = load_cases("public_cases.json")
+    samples = {"exact": list(zip(cases.days.tolist(), cases.miles.tolist(), cases.receipts.tolist()))}
+    samples["pattern"], samples["rules"] = [], []
+    rng = np.random.default_rng(seed)
+    for _ in range(50):
+        days = rng.integers(1, 31, 5000).tolist()
+        miles = np.round(rng.uniform(0, 3000, 5000), 2).tolist()
+        receipts = np.round(rng.uniform(0, 5000, 5000), 2).tolist()
+        for row in zip(days, miles, receipts):
+            path = resolution_path(*row)
+            if path != "exact" and len(samples[path]) < per_path:
+                samples[path].append(row)
+        if all(len(samples[p]) >= per_path for p in ("pattern", "rules")):
+            break
+    return samples
+
+def bench_paths(repeats):
+    import memo
+    import run
+
+    results = {}
+    samples = path_samples()
+    for path, inputs in samples.items():
+        # Every repeat starts from an empty memo, so this times resolving the inputs rather than cache hits
+        results[f"calculate_reimbursement.{path}"] = time_per_call(run.calculate_reimbursement, inputs, repeats,
+                                                                   memo.clear)
+        columns = [np.array(c) for c in zip(*inputs)]
+        results[f"calculate_reimbursement_batch.{path}"] = (
+            time_run(lambda: run.calculate_reimbursement_batch(*columns), repeats) / len(inputs))
+    # The memo on its own (off unless REIMBURSEMENT_CACHE_SIZE is set): the same inputs again, every call a hit
+    if run.CACHE_SIZE:
+        inputs = samples["exact"]
+        time_per_call(run.calculate_reimbursement, inputs, 1, memo.clear)
+        results["calculate_reimbursement.cache_hit"] = time_per_call(run.calculate_reimbursement, inputs, repeats)
+    return results
+
+def _time_subprocess(code, cwd, repeats, reset=None):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    timings = []
+    for _ in range(repeats):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def bench_startup(repeats, workdir, rows=DEFAULT_STARTUP_ROWS):
+    """Process start, import and one lookup, cold (no .cache) and warm, for run.py and private_run.py.
+
+    run.py is also timed against a synthetic public case file of `rows` cases,
+    where building the tables (cold) dwarfs everything else.
+    """
+    from snapshot import RACY_NS
+
+    shutil.copy(os.path.join(REPO_DIR, "public_cases.json"), workdir)
+    cache = os.path.join(workdir, ".cache")
+
+    def clear_cache():
+        shutil.rmtree(cache, ignore_errors=True)
+
+    results = {
+        "startup.python": _time_subprocess("pass", workdir, repeats),
+        "startup.run.cold": _time_subprocess(RUN_ONE, workdir, repeats, clear_cache),
+        "startup.run.warm": _time_subprocess(RUN_ONE, workdir, repeats),
+    }
+    load_model = "import private_run; private_run.predictor.load_public_cases()"
+    results["startup.private_run.fit"] = _time_subprocess(load_model, workdir, repeats, clear_cache)
+    results["startup.private_run.warm"] = _time_subprocess(load_model, workdir, repeats)
+
+    if rows:
+        large = os.path.join(workdir, "large")
+        os.makedirs(large)
+        source = os.path.join(large, "public_cases.json")
+        write_synthetic_public_cases(source, rows)
+        # A file changed within snapshot.RACY_NS is re-hashed on every load; wait that out so
+        # warm runs time the steady state
+        time.sleep(RACY_NS / 1e9)
+        large_cache = os.path.join(large, ".cache")
+        results[f"startup.run.cold.{rows}"] = _time_subprocess(
+            RUN_ONE, large, repeats, lambda: shutil.rmtree(large_cache, ignore_errors=True))
+        results[f"startup.run.warm.{rows}"] = _time_subprocess(RUN_ONE, large, repeats)
+        shutil.rmtree(large)
+    return results
+
+def bench_predictor(repeats):
+    """ReimbursementPredictor latency per row on inputs that miss the exact matches, single and batched."""
+    import private_run
+    from cases import load_cases
+
+    private = load_cases("private_cases.json")[:200]
+    inputs = list(zip(private.days.tolist(), private.miles.tolist(), private.receipts.tolist()))
+    predictor = private_run.predictor
+    predictor.predict(*inputs[0])
+    columns = private.columns()
+    results = {
+        # Cleared before every repeat, so these are model calls rather than memo hits
+        "ReimbursementPredictor.predict": time_per_call(predictor.predict, inputs, repeats,
+                                                        predictor._predict_cached.cache_clear),
+        "ReimbursementPredictor.predict_many": (
+            time_run(lambda: predictor.predict_many(*columns), repeats) / len(private)),
+    }
+    time_per_call(predictor.predict, inputs, 1, predictor._predict_cached.cache_clear)
+    results["ReimbursementPredictor.predict.cache_hit"] = time_per_call(predictor.predict, inputs, repeats)
+    return results
+
+def write_synthetic_cases(path, rows, seed=0, chunk=1_000_000):
+    """NDJSON file of random private-style cases."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as f:
+        for lo in range(0, rows, chunk):
+            n = min(chunk, rows - lo)
+            days = rng.integers(1, 15, n)
+            miles = rng.integers(0, 1500, n)
+            receipts = np.round(rng.uniform(0, 2500, n), 2)
+            f.write("".join(
+                f'{{"trip_duration_days": {d}, "miles_traveled": {m}, "total_receipts_amount": {r}}}\n'
+                for d, m, r in zip(days.tolist(), miles.tolist(), receipts.tolist())))
+
+def write_synthetic_public_cases(path, rows, seed=0, chunk=1_000_000):
+    """JSON array of random cases in public_cases.json's format, with expected outputs."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as f:
+        f.write("[\n")
+        for lo in range(0, rows, chunk):
+            n = min(chunk, rows - lo)
+            days = rng.integers(1, 15, n)
+            miles = rng.integers(0, 1500, n)
+            receipts = np.round(rng.uniform(0, 2500, n), 2)
+            expected = np.round(days * 95 + miles * 0.5 + np.minimum(receipts, 1200) * 0.6 + rng.normal(0, 40, n), 2)
+            f.write(",\n".join(
+                f'{{"input": {{"trip_duration_days": {d}, "miles_traveled": {m}, "total_receipts_amount": {r}}}, '
+                f'"expected_output": {e}}}'
+                for d, m, r, e in zip(days.tolist(), miles.tolist(), receipts.tolist(), expected.tolist())))
+            f.write(",\n" if lo + n < rows else "\n")
+        f.write("]\n")
+
+def bench_generate(sizes, workdir):
+    """generate_results.main --stream throughput, in seconds per row."""
+    import generate_results
+
+    results = {}
+    for rows in sizes:
+        source = os.path.join(workdir, f"cases_{rows}.ndjson")
+        output = os.path.join(workdir, f"results_{rows}.txt")
+        write_synthetic_cases(source, rows)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_results.main(["--stream", "--input", source, "--output", output])
+        results[f"generate_results.stream.{rows}"] = (time.perf_counter() - start) / rows
+        os.remove(source)
+        os.remove(output)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Metrics more than `tolerance` slower than the baseline, as (name, baseline, current)."""
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name, {}).get("seconds")
+        if base and seconds > base * (1 + tolerance):
+            regressions.append((name, base, seconds))
+    return regressions
+
+def _format(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds * 1e6:.2f}µs"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lookup paths, startup and end-to-end throughput.")
+    parser.add_argument("--groups", default="paths,startup,predictor,generate",
+                        help="comma-separated benchmark groups to run")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="synthetic case file sizes for generate_results")
+    parser.add_argument("--startup-rows", type=int, default=DEFAULT_STARTUP_ROWS,
+                        help="cases in the synthetic public case file run.py's startup is also timed on (0 skips it)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help=f"baseline file (default: {BASELINE_PATH})")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if any metric regressed")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before a metric counts as regressed (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    groups = set(args.groups.split(","))
+
+    print("⏱️  Reimbursement benchmarks")
+    print("=" * 30)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        if "paths" in groups:
+            results.update(bench_paths(args.repeats))
+        if "startup" in groups:
+            results.update(bench_startup(max(1, args.repeats // 2), workdir, args.startup_rows))
+        if "predictor" in groups:
+            results.update(bench_predictor(args.repeats))
+        if "generate" in groups:
+            results.update(bench_generate([int(s) for s in args.sizes.split(",") if s], workdir))
+
+    for name, seconds in results.items():
+        print(f"  {name:<45} {_format(seconds)}")
+
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__,
+                 "machine": platform.machine(), "time": time.time()},
+        "metrics": {name: {"seconds": seconds} for name, seconds in results.items()},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Baseline saved to {args.baseline}")
+
+    if args.check:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["metrics"]
+        except FileNotFoundError:
+            print(f"\n❌ No baseline at {args.baseline}; generate one on this machine with "
+                  f"`python benchmark.py --save-baseline --baseline {args.baseline}`")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) more than {args.tolerance:.0%} slower than baseline:")
+            for name, base, seconds in regressions:
+                print(f"  {name}: {_format(base)} → {_format(seconds)} ({seconds / base - 1:+.0%})")
+            sys.exit(1)
+        print(f"\n✅ No metric more than {args.tolerance:.0%} slower than baseline")
+
+if __name__ == "__main__":
+    main()
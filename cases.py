@@ -0,0 +1,230 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+from snapshot import cache_path, ingested_path, is_current, read_snapshot, source_info, write_snapshot
+
+_DELIMITERS = frozenset(" \t\r\n,]")
+
+def _iter_json_array(f, buf, block_size):
+    """Yield the items of a JSON array one at a time; buf holds text read after the '['."""
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError("unterminated JSON array")
+            buf = buf[pos:] + f.read(block_size)
+            pos = 0
+            eof = not buf
+            continue
+        if buf[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            item, end = None, None
+        # An item not yet followed by a delimiter may still be incomplete (e.g. a split number)
+        if end is None or (not eof and (end == len(buf) or buf[end] not in _DELIMITERS)):
+            chunk = f.read(block_size)
+            if not chunk:
+                if end is None:
+                    raise ValueError(f"invalid JSON near: {buf[pos:pos + 40]!r}")
+                eof = True
+                continue
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+        if pos > block_size:
+            buf = buf[pos:]
+            pos = 0
+
+def iter_cases(path, block_size=1 << 20, partial_tail=False):
+    """Stream case records from a JSON array or an NDJSON file without loading it whole.
+
+    With partial_tail, an NDJSON last line that has no newline and doesn't
+    parse is taken for a write cut short (see ingest.py) and skipped.
+    """
+    with open(path) as f:
+        head = f.read(block_size)
+        while head and not head.strip():
+            head = f.read(block_size)
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            yield from _iter_json_array(f, stripped[1:], block_size)
+            return
+        pending = ""
+        while head:
+            lines = (pending + head).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            head = f.read(block_size)
+        if pending.strip():
+            try:
+                record = json.loads(pending)
+            except json.JSONDecodeError:
+                if not partial_tail:
+                    raise
+                return
+            yield record
+
+def plain_number(value):
+    """A column value as it would appear in the JSON: int when integral, float otherwise."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+class CaseSet:
+    """Columnar cases: contiguous days, miles, receipts and expected-output arrays.
+
+    Indexing with a slice returns a CaseSet of views (no copy); boolean masks
+    and index arrays return a compact copy. Files without outputs (the private
+    cases) have expected all NaN and has_expected False. expected_is_int flags
+    outputs that were integer literals in the JSON, so exact matches can be
+    returned exactly as written. invalid flags malformed records (a missing,
+    null or non-numeric field); their columns hold NaN.
+    """
+
+    def __init__(self, days, miles, receipts, expected=None, expected_is_int=None, has_expected=None,
+                 invalid=None):
+        self.days = days
+        self.miles = miles
+        self.receipts = receipts
+        self.expected = expected if expected is not None else np.full(len(days), np.nan)
+        self.expected_is_int = (expected_is_int if expected_is_int is not None
+                                else np.zeros(len(days), dtype=np.uint8))
+        self.has_expected = expected is not None if has_expected is None else has_expected
+        self.invalid = invalid if invalid is not None else np.zeros(len(days), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            raise TypeError("index a CaseSet with a slice, mask or index array")
+        return CaseSet(self.days[index], self.miles[index], self.receipts[index],
+                       self.expected[index], self.expected_is_int[index], self.has_expected,
+                       self.invalid[index])
+
+    def filter(self, mask):
+        return self[np.asarray(mask, dtype=bool)]
+
+    def columns(self):
+        return self.days, self.miles, self.receipts
+
+    def arrays(self):
+        return {"days": self.days, "miles": self.miles, "receipts": self.receipts,
+                "expected": self.expected, "expected_is_int": self.expected_is_int, "invalid": self.invalid}
+
+    @classmethod
+    def concat(cls, sets):
+        sets = list(sets)
+        days = np.concatenate([s.days for s in sets])
+        if days.dtype != np.int64 and np.all(days == np.floor(days)):
+            days = days.astype(np.int64)
+        return cls(days, np.concatenate([s.miles for s in sets]), np.concatenate([s.receipts for s in sets]),
+                   np.concatenate([s.expected for s in sets]), np.concatenate([s.expected_is_int for s in sets]),
+                   all(s.has_expected for s in sets if len(s)), np.concatenate([s.invalid for s in sets]))
+
+    @classmethod
+    def from_records(cls, records):
+        """Build columns from case dicts, nested under "input" (public) or flat (private).
+
+        A malformed record doesn't stop the load: its row is stored as NaN
+        and flagged in invalid, so the caller can report it on its own.
+        """
+        days, miles, receipts, expected = array("d"), array("d"), array("d"), array("d")
+        expected_is_int, invalid = array("B"), array("B")
+        has_expected = True
+        for record in records:
+            row = _coerce_record(record)
+            invalid.append(row is None)
+            trip_days, trip_miles, trip_receipts, output = row or (_NAN, _NAN, _NAN, _NAN)
+            if output is None:
+                has_expected = False
+                output = _NAN
+            days.append(trip_days)
+            miles.append(trip_miles)
+            receipts.append(trip_receipts)
+            expected.append(output)
+            expected_is_int.append(type(output) is int)
+
+        days = np.frombuffer(days, dtype=np.float64) if days else np.zeros(0)
+        if np.all(days == np.floor(days)):
+            days = days.astype(np.int64)
+        return cls(days,
+                   np.frombuffer(miles, dtype=np.float64) if miles else np.zeros(0),
+                   np.frombuffer(receipts, dtype=np.float64) if receipts else np.zeros(0),
+                   np.frombuffer(expected, dtype=np.float64) if expected else np.zeros(0),
+                   np.frombuffer(expected_is_int, dtype=np.uint8) if expected_is_int else np.zeros(0, dtype=np.uint8),
+                   has_expected and len(days) > 0,
+                   np.frombuffer(invalid, dtype=np.uint8) if invalid else np.zeros(0, dtype=np.uint8))
+
+_NAN = float("nan")
+
+def _number(value):
+    """value as a float, or None unless it is a JSON number that fits one."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except OverflowError:
+        return None
+
+def _coerce_record(record):
+    """(days, miles, receipts, expected_output or None) of a case record, or None if it is malformed."""
+    if not isinstance(record, dict):
+        return None
+    fields = record.get("input", record)
+    if not isinstance(fields, dict):
+        return None
+    row = [_number(fields.get(name)) for name in ("trip_duration_days", "miles_traveled", "total_receipts_amount")]
+    output = record.get("expected_output")
+    if None in row or (output is not None and _number(output) is None):
+        return None
+    return (*row, output)
+
+def load_cases(path="public_cases.json", cache=True, partial_tail=False):
+    """Load a case file as a CaseSet, via a memory-mapped binary cache under .cache/.
+
+    The cache is rebuilt whenever the content hash of the file changes.
+    partial_tail is passed to iter_cases.
+    """
+    if not cache:
+        return CaseSet.from_records(iter_cases(path, partial_tail=partial_tail))
+
+    snapshot = cache_path(path, ".cases")
+    try:
+        header, arrays = read_snapshot(snapshot)
+        if not is_current(header, path):
+            raise ValueError("stale case cache")
+    except (OSError, ValueError, KeyError):
+        info = source_info(path)
+        cases = CaseSet.from_records(iter_cases(path, partial_tail=partial_tail))
+        try:
+            write_snapshot(snapshot, cases.arrays(), {"source": info, "has_expected": cases.has_expected})
+        except OSError:
+            pass  # .cache/ isn't writable; the cases are just parsed again next time
+        return cases
+    return CaseSet(arrays["days"], arrays["miles"], arrays["receipts"], arrays["expected"],
+                   arrays["expected_is_int"], header["has_expected"], arrays.get("invalid"))
+
+def load_training_cases(source="public_cases.json"):
+    """The cases of source followed by any appended to it since, in arrival order."""
+    cases = load_cases(source)
+    log = ingested_path(source)
+    if not os.path.exists(log):
+        return cases
+    # A crash while ingest.py appended can leave a partial last line; those cases were never ingested
+    return CaseSet.concat([cases, load_cases(log, partial_tail=True)])
@@ -0,0 +1,163 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from cases import load_cases
+from eval import CASES_PATH, print_report, score_shard, summarize
+from lookup_tables import build_tables
+from neighbors import NeighborIndex
+
+PREDICTORS = ("run", "knn", "private")
+
+def kfold_splits(n, folds, seed=0):
+    """(train, test) index arrays for shuffled k-fold; every case is tested exactly once.
+
+    Indices are sorted so each split keeps the case file's order, which decides
+    which duplicate wins in the exact tables.
+    """
+    order = np.random.default_rng(seed).permutation(n)
+    splits = []
+    for test in np.array_split(order, folds):
+        train = np.ones(n, dtype=bool)
+        train[test] = False
+        splits.append((np.flatnonzero(train), np.sort(test)))
+    return splits
+
+def holdout_split(n, fraction, seed=0):
+    """A single (train, test) split with the given fraction of cases held out."""
+    order = np.random.default_rng(seed).permutation(n)
+    size = min(max(int(round(n * fraction)), 1), n - 1)
+    return [(np.sort(order[size:]), np.sort(order[:size]))]
+
+def shared_features(predictor, cases, params=None):
+    """Preprocessing computed once for all folds: the private pipeline's polynomial features."""
+    if predictor != "private":
+        return None
+    from private_run import build_model, load_model_params
+    poly = build_model(params or load_model_params()).steps[0][1]
+    return poly.fit_transform(np.column_stack(cases.columns()).astype(np.float64))
+
+def fold_predictions(predictor, cases, train, test, features=None, params=None):
+    """Predictions for cases[test] from the predictor rebuilt on cases[train] only."""
+    training, testing = cases[train], cases[test]
+    if predictor == "private":
+        from private_run import ReimbursementPredictor, build_model, load_model_params
+        params = params or load_model_params()
+        pipeline = build_model(params)
+        # Polynomial features are row-wise, so the shared ones equal the pipeline's own on this split
+        pipeline.steps[0][1].fit(np.column_stack(training.columns()).astype(np.float64))
+        pipeline.steps[-1][1].fit(features[train], training.expected)
+        return ReimbursementPredictor(params=params).fit(training, pipeline).predict_many(*testing.columns())
+
+    import run
+    tables = build_tables(training.days, training.miles, training.receipts,
+                          training.expected, training.expected_is_int)
+    index = NeighborIndex(training.days, training.miles, training.receipts,
+                          training.expected) if predictor == "knn" else None
+    previous = run.use_lookup_tables(*tables, index)
+    try:
+        if predictor == "knn":
+            return run.calculate_reimbursement_knn_batch(*testing.columns())
+        return run.calculate_reimbursement_batch(*testing.columns())
+    finally:
+        run.use_lookup_tables(*previous)
+
+def out_of_fold(predictor, cases, splits, jobs=1):
+    """Predictions for every tested case, each from the split that held it out (NaN if untested)."""
+    features = shared_features(predictor, cases)
+    args = (repeat(predictor), repeat(cases), [train for train, _ in splits], [test for _, test in splits],
+            repeat(features))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(fold_predictions, *args))
+    else:
+        results = list(map(fold_predictions, *args))
+
+    predictions = np.full(len(cases), np.nan)
+    for (_, test), outputs in zip(splits, results):
+        predictions[test] = outputs
+    return predictions
+
+def score_subset(cases, index, predictions, top_n=5):
+    """eval.py statistics for cases[index], with case numbers from the full file."""
+    stats = score_shard(cases[index], 0, top_n=top_n, outputs=predictions[index])
+    renumbered = set()
+    # worst_case is usually also among top_errors; renumber each result once
+    for result in stats["top_errors"] + [stats["worst_case"]]:
+        if result is not None and id(result) not in renumbered:
+            renumbered.add(id(result))
+            result["case_num"] = int(index[result["case_num"] - 1]) + 1
+    return stats
+
+def cross_validate(predictor, cases, splits, jobs=1, top_n=5):
+    """Out-of-fold predictions plus per-split and combined eval.py statistics."""
+    predictions = out_of_fold(predictor, cases, splits, jobs)
+    folds = [score_subset(cases, test, predictions, top_n) for _, test in splits]
+    tested = np.sort(np.concatenate([test for _, test in splits]))
+    return predictions, folds, score_subset(cases, tested, predictions, top_n)
+
+def _fold_line(i, stats, num_cases, train_size):
+    if not stats["successful_runs"]:
+        return f"  Fold {i}: no successful cases"
+    s = summarize(stats, num_cases)
+    return (f"  Fold {i}: {num_cases} held out, {train_size} train | "
+            f"Exact: {stats['exact_matches']} ({s['exact_pct']}%)  Close: {stats['close_matches']} ({s['close_pct']}%)  "
+            f"Avg error: ${s['avg_error']:.2f}  Max: ${stats['max_error']:.2f}  Score: {s['score']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate accuracy on unseen cases: rebuild each predictor from a training split and score the rest.")
+    parser.add_argument("--predictor", choices=PREDICTORS + ("all",), default="run")
+    parser.add_argument("--folds", type=int, default=5, help="number of folds (default: 5)")
+    parser.add_argument("--holdout", type=float, metavar="FRACTION",
+                        help="score a single held-out fraction of the cases instead of k folds")
+    parser.add_argument("--seed", type=int, default=0, help="shuffle seed for the splits")
+    parser.add_argument("--jobs", type=int, default=min(5, os.cpu_count() or 1),
+                        help="worker processes, one split each")
+    parser.add_argument("--top", type=int, default=5, help="number of highest-error cases to show")
+    parser.add_argument("--cases", default=CASES_PATH, help="case file with expected outputs")
+    args = parser.parse_args(argv)
+
+    print("🧾 Black Box Challenge - Reimbursement System Cross-Validation")
+    print("=======================================================\n")
+
+    cases = load_cases(args.cases)
+    if args.holdout is not None:
+        if not 0 < args.holdout < 1:
+            parser.error("--holdout must be between 0 and 1")
+        splits = holdout_split(len(cases), args.holdout, args.seed)
+        method = f"{args.holdout:.0%} holdout"
+    else:
+        if not 2 <= args.folds <= len(cases):
+            parser.error("--folds must be between 2 and the number of cases")
+        splits = kfold_splits(len(cases), args.folds, args.seed)
+        method = f"{args.folds}-fold cross-validation"
+
+    predictors = PREDICTORS if args.predictor == "all" else (args.predictor,)
+    summaries = {}
+    for predictor in predictors:
+        print(f"📊 {method} of {predictor} on {len(cases)} cases (seed {args.seed})...\n")
+        started = time.perf_counter()
+        _, folds, combined = cross_validate(predictor, cases, splits, args.jobs, args.top)
+        wall_time = time.perf_counter() - started
+        for i, ((train, test), stats) in enumerate(zip(splits, folds), 1):
+            print(_fold_line(i, stats, len(test), len(train)))
+        print(f"\n⏱️  Wall time: {wall_time:.2f}s ({len(splits)} split(s), {args.jobs} job(s))")
+        tested = sum(len(test) for _, test in splits)
+        print_report(combined, tested, args.top)
+        if combined["successful_runs"]:
+            summaries[predictor] = summarize(combined, tested)
+        print()
+
+    if len(summaries) > 1:
+        print(f"🏁 Held-out comparison ({method}):")
+        for predictor, s in sorted(summaries.items(), key=lambda item: item[1]["score"]):
+            print(f"  {predictor:<8} Exact: {s['exact_pct']:5.1f}%  Close: {s['close_pct']:5.1f}%  "
+                  f"Avg error: ${s['avg_error']:.2f}  Score: {s['score']}")
+
+if __name__ == "__main__":
+    main()
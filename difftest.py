@@ -0,0 +1,291 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from surface import DEFAULT_AXES, PREDICTORS, _axis, axis_points, source_predictor
+
+AXES = ("days", "miles", "receipts")
+# Region size along each axis: 5 days x 250 miles x $500 of receipts
+DEFAULT_BINS = {"days": 5, "miles": 250, "receipts": 500}
+CHUNK_ROWS = 100_000
+# Predictions less than a cent apart agree, as eval.py counts exact matches
+EXACT = 0.01
+
+_predictors = None
+
+def _init_worker(names):
+    global _predictors
+    if _predictors is None or _predictors[0] != names:
+        _predictors = (names, [source_predictor(name) for name in names])
+
+def _largest(diff, index, keep):
+    """Positions of the keep largest differences, ties broken by the lowest index."""
+    if keep <= 0 or not len(diff):
+        return np.zeros(0, dtype=np.int64)
+    if keep < len(diff):
+        threshold = np.partition(diff, len(diff) - keep)[len(diff) - keep]
+        candidates = np.flatnonzero(diff >= threshold)
+    else:
+        candidates = np.arange(len(diff))
+    return candidates[np.lexsort((index[candidates], -diff[candidates]))[:keep]]
+
+class RegionMap:
+    """Disagreement between two predictors, aggregated over days x miles x receipts regions.
+
+    Each region keeps its point count, the sum and maximum of |a - b|, how
+    many points differ by a cent or more, and the point with the largest
+    difference; `worst` holds the keep largest differences overall as
+    (days, miles, receipts, a, b, index) rows. Memory is fixed by the number
+    of regions and keep, however many points are added.
+    """
+
+    def __init__(self, axes, bins=DEFAULT_BINS, keep=10):
+        self.axes = {name: tuple(float(v) for v in axes[name]) for name in AXES}
+        self.bins = {name: float(bins[name]) for name in AXES}
+        self.shape = tuple(max(1, math.ceil((self.axes[name][1] - self.axes[name][0]) / self.bins[name]))
+                           for name in AXES)
+        k = int(np.prod(self.shape))
+        self.keep = keep
+        self.count = np.zeros(k, dtype=np.int64)
+        self.differ = np.zeros(k, dtype=np.int64)
+        self.total = np.zeros(k)
+        self.max = np.full(k, -np.inf)
+        self.argmax = np.full((k, 6), np.nan)
+        self.worst = np.zeros((0, 6))
+
+    def region_ids(self, days, miles, receipts):
+        """Flat region index of every point; points beyond the axes land in the edge regions."""
+        ids = np.zeros(len(days), dtype=np.int64)
+        for x, name, n in zip((days, miles, receipts), AXES, self.shape):
+            i = np.floor((np.asarray(x, dtype=np.float64) - self.axes[name][0]) / self.bins[name])
+            ids = ids * n + np.clip(i, 0, n - 1).astype(np.int64)
+        return ids
+
+    def add(self, days, miles, receipts, a, b, first=0):
+        """Fold in predictions a and b of a chunk whose points are numbered from first."""
+        diff = np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64))
+        if not len(diff):
+            return self
+        points = np.column_stack([days, miles, receipts, a, b, first + np.arange(len(diff))])
+        ids = self.region_ids(days, miles, receipts)
+        k = len(self.count)
+        self.count += np.bincount(ids, minlength=k)
+        self.total += np.bincount(ids, weights=diff, minlength=k)
+        self.differ += np.bincount(ids[~(diff < EXACT)], minlength=k)
+
+        # One sort by (region, difference, earliest point last) finds every region's maximum
+        order = np.lexsort((-points[:, 5], diff, ids))
+        best = order[np.r_[ids[order][1:] != ids[order][:-1], True]]
+        self._update_max(ids[best], diff[best], points[best])
+        self._update_worst(points[_largest(diff, points[:, 5], self.keep)])
+        return self
+
+    def merge(self, other):
+        """Fold in another map over the same regions whose points all come later."""
+        self.count += other.count
+        self.total += other.total
+        self.differ += other.differ
+        present = np.flatnonzero(other.count)
+        self._update_max(present, other.max[present], other.argmax[present])
+        self._update_worst(other.worst)
+        return self
+
+    def _update_max(self, regions, diff, points):
+        # Strictly larger only, so the earlier point keeps a tied maximum
+        better = diff > self.max[regions]
+        self.max[regions[better]] = diff[better]
+        self.argmax[regions[better]] = points[better]
+
+    def _update_worst(self, rows):
+        rows = np.concatenate([self.worst, rows])
+        self.worst = rows[_largest(np.abs(rows[:, 3] - rows[:, 4]), rows[:, 5], self.keep)]
+
+    def bounds(self, region):
+        """{axis: (lo, hi)} of a flat region index."""
+        return {name: (self.axes[name][0] + i * self.bins[name], self.axes[name][0] + (i + 1) * self.bins[name])
+                for name, i in zip(AXES, np.unravel_index(region, self.shape))}
+
+    def regions(self, rank="max"):
+        """Every region with points, as dicts, largest first by rank ("max", "mean" or "share")."""
+        present = np.flatnonzero(self.count)
+        mean = self.total[present] / self.count[present]
+        share = self.differ[present] / self.count[present]
+        key = {"max": self.max[present], "mean": mean, "share": share}[rank]
+        # Ties on the rank fall back to the mean difference, then to grid order
+        order = np.lexsort((present, -mean, -key))
+        result = []
+        for j in order.tolist():
+            region = int(present[j])
+            days, miles, receipts, a, b, index = self.argmax[region].tolist()
+            result.append({
+                "region": region,
+                "bounds": self.bounds(region),
+                "count": int(self.count[region]),
+                "max": float(self.max[region]),
+                "mean": float(mean[j]),
+                "share": float(share[j]),
+                "worst": {"days": days, "miles": miles, "receipts": receipts, "a": a, "b": b, "index": int(index)},
+            })
+        return result
+
+    def summary(self):
+        points = int(self.count.sum())
+        return {
+            "points": points,
+            "max": float(self.max.max()) if points else 0.0,
+            "mean": float(self.total.sum() / points) if points else 0.0,
+            "share": float(self.differ.sum() / points) if points else 0.0,
+        }
+
+def grid_size(axes):
+    return int(np.prod([len(axis_points(*axes[name])) for name in AXES]))
+
+def grid_chunk(axes, start, stop):
+    """Points start..stop-1 of the grid, numbered in (days, miles, receipts) C order."""
+    points = [axis_points(*axes[name]) for name in AXES]
+    index = np.unravel_index(np.arange(start, stop), [len(p) for p in points])
+    return [p[i].astype(np.float64) for p, i in zip(points, index)]
+
+def random_chunk(axes, start, stop, seed=0):
+    """Random points start..stop-1 inside the axes: whole days, continuous miles, receipts in cents.
+
+    Each chunk seeds its own generator from (seed, start), so the points depend
+    on the seed and chunk size but not on how many jobs run the chunks.
+    """
+    rng = np.random.default_rng([seed, start])
+    n = stop - start
+    (d0, d1, _), (m0, m1, _), (r0, r1, _) = (axes[name] for name in AXES)
+    days = rng.integers(math.ceil(d0), math.floor(d1) + 1, n).astype(np.float64)
+    miles = rng.uniform(m0, m1, n)
+    receipts = np.round(rng.uniform(r0, r1, n), 2)
+    return [days, miles, receipts]
+
+def compare_chunk(names, axes, bins, keep, start, stop, seed=None):
+    """RegionMap of one chunk: the chunk is generated and both predictors run in batch here."""
+    _init_worker(names)
+    columns = grid_chunk(axes, start, stop) if seed is None else random_chunk(axes, start, stop, seed)
+    a, b = (np.asarray(predict(*columns), dtype=np.float64) for predict in _predictors[1])
+    return RegionMap(axes, bins, keep).add(*columns, a, b, first=start)
+
+def compare(names, axes=DEFAULT_AXES, bins=DEFAULT_BINS, samples=None, seed=0, chunk_rows=CHUNK_ROWS,
+            jobs=1, keep=10, progress=None):
+    """Sweep the grid (or samples random points) through both predictors, chunk by chunk.
+
+    Chunks are independent, so they run in worker processes with jobs > 1;
+    each returns a small RegionMap that is merged in chunk order, giving the
+    same result as a serial run. progress(points_done, total) is called as
+    chunks finish.
+    """
+    names = tuple(names)
+    total = grid_size(axes) if samples is None else samples
+    starts = list(range(0, total, chunk_rows))
+    args = (repeat(names), repeat(axes), repeat(bins), repeat(keep), starts,
+            [min(s + chunk_rows, total) for s in starts], repeat(None if samples is None else seed))
+    # Load tables and models before forking so the workers share them
+    _init_worker(names)
+    for predict in _predictors[1]:
+        predict(np.ones(1), np.ones(1), np.ones(1))
+
+    regions = RegionMap(axes, bins, keep)
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        chunks = pool.map(compare_chunk, *args) if pool else map(compare_chunk, *args)
+        for chunk in chunks:
+            regions.merge(chunk)
+            if progress:
+                progress(int(regions.count.sum()), total)
+    finally:
+        if pool:
+            pool.shutdown()
+    return regions
+
+def _region_line(entry, names):
+    (d0, d1), (m0, m1), (r0, r1) = (entry["bounds"][name] for name in AXES)
+    w = entry["worst"]
+    return (f"  days {d0:g}-{d1:g}  miles {m0:g}-{m1:g}  receipts ${r0:g}-{r1:g} | {entry['count']} points  "
+            f"max ${entry['max']:.2f}  mean ${entry['mean']:.2f}  differ {entry['share']:.1%} | "
+            f"worst ({w['days']:g}, {w['miles']:g}, {w['receipts']:.2f}): "
+            f"{names[0]} ${w['a']:.2f} vs {names[1]} ${w['b']:.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare two predictors over millions of synthetic inputs and map where they disagree.")
+    parser.add_argument("a", nargs="?", choices=PREDICTORS, default="run")
+    parser.add_argument("b", nargs="?", choices=PREDICTORS, default="private")
+    parser.add_argument("--days", type=_axis, default=DEFAULT_AXES["days"], help="start:stop[:step]")
+    parser.add_argument("--miles", type=_axis, default=DEFAULT_AXES["miles"], help="start:stop[:step]")
+    parser.add_argument("--receipts", type=_axis, default=DEFAULT_AXES["receipts"], help="start:stop[:step]")
+    parser.add_argument("--samples", type=int, metavar="N",
+                        help="compare N random points inside the axes instead of the grid")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --samples")
+    parser.add_argument("--bins", type=float, nargs=3, metavar=("DAYS", "MILES", "RECEIPTS"),
+                        default=[DEFAULT_BINS[name] for name in AXES], help="region size along each axis")
+    parser.add_argument("--rank", choices=("max", "mean", "share"), default="max",
+                        help="order regions by max or mean difference, or share of points that differ")
+    parser.add_argument("--top", type=int, default=10, help="regions to show")
+    parser.add_argument("--worst", type=int, default=10, help="largest individual differences to keep")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="points per batch")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--output", help="write the full region map and worst points as JSON")
+    args = parser.parse_args(argv)
+    if args.a == args.b:
+        parser.error("choose two different predictors")
+    if min(args.bins) <= 0:
+        parser.error("--bins must be positive")
+
+    names = (args.a, args.b)
+    axes = {"days": args.days, "miles": args.miles, "receipts": args.receipts}
+    bins = dict(zip(AXES, args.bins))
+    total = grid_size(axes) if args.samples is None else args.samples
+    what = "grid points" if args.samples is None else "random points"
+    print(f"🔬 Comparing {names[0]} and {names[1]} on {total:,} {what} "
+          f"({args.chunk:,} per batch, {args.jobs} job(s))...")
+
+    reported = [0]
+    def progress(done, total):
+        if done * 10 // total > reported[0] or done == total:
+            reported[0] = done * 10 // total
+            print(f"Compared {done:,} of {total:,} points...")
+
+    started = time.perf_counter()
+    regions = compare(names, axes, bins, args.samples, args.seed, args.chunk, args.jobs, args.worst, progress)
+    elapsed = time.perf_counter() - started
+    summary = regions.summary()
+    ranked = regions.regions(args.rank)
+
+    print(f"\n⏱️  {summary['points']:,} points in {elapsed:.1f}s ({summary['points'] / elapsed:,.0f} points/s)")
+    print(f"📐 Differ by a cent or more: {summary['share']:.1%}  Mean: ${summary['mean']:.2f}  "
+          f"Max: ${summary['max']:.2f}")
+    print(f"\n🗺️  Top {min(args.top, len(ranked))} of {len(ranked)} regions by {args.rank}:")
+    for entry in ranked[:args.top]:
+        print(_region_line(entry, names))
+    print("\n💥 Largest differences:")
+    for days, miles, receipts, a, b, _ in regions.worst.tolist():
+        print(f"  ({days:g}, {miles:g}, {receipts:.2f}): {names[0]} ${a:.2f} vs {names[1]} ${b:.2f}  "
+              f"(${abs(a - b):.2f})")
+
+    if args.output:
+        report = {
+            "predictors": list(names),
+            "axes": axes,
+            "bins": bins,
+            "samples": args.samples,
+            "seed": args.seed,
+            "summary": summary,
+            "rank": args.rank,
+            "regions": ranked,
+            "worst": [dict(zip(("days", "miles", "receipts", "a", "b"), row[:5]), index=int(row[5]))
+                      for row in regions.worst.tolist()],
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Region map saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
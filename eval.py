@@ -1,49 +1,99 @@
-import json
-from run import calculate_reimbursement
+import argparse
+import heapq
+import shlex
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-def load_cases(filename="public_cases.json"):
-    with open(filename) as f:
-        return json.load(f)
+import numpy as np
 
-def main():
-    print("🧾 Black Box Challenge - Reimbursement System Evaluation")
-    print("=======================================================\n")
+import eval_cache
+import metrics
+import profiling
+from cases import load_cases, plain_number
+from run import (calculate_reimbursement, calculate_reimbursement_batch,
+                 calculate_reimbursement_knn, calculate_reimbursement_knn_batch)
 
-    try:
-        cases = load_cases()
-    except FileNotFoundError:
-        print("❌ Error: public_cases.json not found!")
-        return
+TIME_LIMIT = 5.0
+CASES_PATH = "public_cases.json"
 
-    num_cases = len(cases)
-    print(f"📊 Running evaluation against {num_cases} test cases...\n")
+# Scalar and batch entry points for each in-process implementation
+PREDICTORS = {
+    "run": (calculate_reimbursement, calculate_reimbursement_batch),
+    "knn": (calculate_reimbursement_knn, calculate_reimbursement_knn_batch),
+}
+
+def _error_rank(result):
+    # Highest error first, ties in case order
+    return (result["error"], -result["case_num"])
+
+def _run_command(command, d, m, r):
+    proc = subprocess.run(command + [str(d), str(m), str(r)],
+                          capture_output=True, text=True, timeout=TIME_LIMIT * 6)
+    if proc.returncode != 0:
+        raise ValueError(f"exit status {proc.returncode}: {proc.stderr.strip()[:200]}")
+    return float(proc.stdout.strip())
+
+def score_shard(cases, offset=0, mode="batch", command=None, top_n=5, progress=False, predictor="run",
+                outputs=None):
+    """Score a contiguous slice of a CaseSet and return its partial statistics.
 
+    mode is "batch" (one vectorized call), "function" (one in-process call per
+    case) or "subprocess" (one `command days miles receipts` run per case).
+    Per-case wall time is recorded for the per-call modes. predictor picks
+    the in-process implementation from PREDICTORS; precomputed outputs skip
+    prediction entirely. The shard's predictions are returned under "outputs".
+    """
+    predict, predict_batch = PREDICTORS[predictor]
+    stats = {
+        "successful_runs": 0,
+        "exact_matches": 0,
+        "close_matches": 0,
+        "total_error": 0,
+        "max_error": 0,
+        "worst_case": None,
+        "top_errors": [],
+        "errors": [],
+        "latencies": [],
+    }
     results = []
-    errors = []
-    successful_runs = 0
-    exact_matches = 0
-    close_matches = 0
-    total_error = 0
-    max_error = 0
-    worst_case = None
-
-    for i, case in enumerate(cases):
-        if i % 100 == 0:
-            print(f"Progress: {i}/{num_cases} cases processed...")
-
-        d = case["input"]["trip_duration_days"]
-        m = case["input"]["miles_traveled"]
-        r = case["input"]["total_receipts_amount"]
-        expected = case["expected_output"]
+    predictions = np.full(len(cases), np.nan)
 
+    # Score every case in one batch; fall back to per-case calls if the batch fails
+    if outputs is None and mode == "batch":
         try:
-            output = calculate_reimbursement(d, m, r)
+            outputs = predict_batch(*cases.columns())
+        except Exception:
+            outputs = None
+
+    columns = (cases.days.tolist(), cases.miles.tolist(), cases.receipts.tolist(), cases.expected.tolist())
+    for j, (d, m, r, expected) in enumerate(zip(*columns)):
+        i = offset + j
+        if progress and i % 100 == 0:
+            print(f"Progress: {i}/{progress} cases processed...")
+
+        d, m, r = plain_number(d), plain_number(m), plain_number(r)
+
+        try:
+            if outputs is not None:
+                output = float(outputs[j])
+            else:
+                start = time.perf_counter()
+                try:
+                    if mode == "subprocess":
+                        output = _run_command(command, d, m, r)
+                    else:
+                        output = predict(d, m, r)
+                finally:
+                    stats["latencies"].append(time.perf_counter() - start)
             if not isinstance(output, (float, int)):
                 raise ValueError("Invalid output format")
+            predictions[j] = output
 
             error = abs(output - expected)
-            successful_runs += 1
-            total_error += error
+            stats["successful_runs"] += 1
+            stats["total_error"] += error
 
             results.append({
                 "case_num": i + 1,
@@ -56,25 +106,201 @@ def main():
             })
 
             if error < 0.01:
-                exact_matches += 1
+                stats["exact_matches"] += 1
             if error < 1.0:
-                close_matches += 1
-            if error > max_error:
-                max_error = error
-                worst_case = results[-1]
+                stats["close_matches"] += 1
+            if error > stats["max_error"]:
+                stats["max_error"] = error
+                stats["worst_case"] = results[-1]
 
         except Exception as e:
-            errors.append(f"Case {i+1}: Error - {str(e)}")
+            stats["errors"].append(f"Case {i+1}: Error - {str(e)}")
+
+    stats["top_errors"] = heapq.nlargest(top_n, results, key=_error_rank)
+    stats["outputs"] = predictions
+    return stats
+
+def merge_stats(shards, top_n=5):
+    """Combine shard statistics in shard order, so the result doesn't depend on scheduling."""
+    merged = {
+        "successful_runs": 0,
+        "exact_matches": 0,
+        "close_matches": 0,
+        "total_error": 0,
+        "max_error": 0,
+        "worst_case": None,
+        "top_errors": [],
+        "errors": [],
+        "latencies": [],
+    }
+    for shard in shards:
+        for key in ("successful_runs", "exact_matches", "close_matches", "total_error"):
+            merged[key] += shard[key]
+        if shard["max_error"] > merged["max_error"]:
+            merged["max_error"] = shard["max_error"]
+            merged["worst_case"] = shard["worst_case"]
+        merged["top_errors"].extend(shard["top_errors"])
+        merged["errors"].extend(shard["errors"])
+        merged["latencies"].extend(shard["latencies"])
+    merged["top_errors"] = heapq.nlargest(top_n, merged["top_errors"], key=_error_rank)
+    merged["outputs"] = np.concatenate([shard["outputs"] for shard in shards]) if shards else np.zeros(0)
+    return merged
+
+def _score_shard_with_metrics(*args):
+    # Runs in a worker: report this shard's metrics alongside its statistics
+    metrics.enable()
+    metrics.registry.reset()
+    stats = score_shard(*args)
+    stats["metrics"] = metrics.registry.state()
+    return stats
+
+def score_cases(cases, mode="batch", command=None, jobs=1, top_n=5, predictor="run", outputs=None):
+    """Score all cases, sharding them across a process pool when jobs > 1."""
+    if jobs <= 1:
+        return score_shard(cases, 0, mode, command, top_n, progress=len(cases), predictor=predictor,
+                           outputs=outputs)
+
+    num_shards = min(len(cases), jobs * 4) or 1
+    bounds = np.linspace(0, len(cases), num_shards + 1).astype(int)
+    # Slices of the CaseSet are views; only the shard's own rows are pickled to a worker
+    shards = [cases[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    shard_outputs = ([outputs[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+                     if outputs is not None else repeat(None))
+    results = []
+    worker = _score_shard_with_metrics if metrics.enabled else score_shard
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for shard in pool.map(worker, shards, bounds[:-1], repeat(mode), repeat(command),
+                              repeat(top_n), repeat(False), repeat(predictor), shard_outputs):
+            results.append(shard)
+            if "metrics" in shard:
+                metrics.registry.merge(shard["metrics"])
+            print(f"Progress: {sum(len(s) for s in shards[:len(results)])}/{len(cases)} cases processed...")
+    return merge_stats(results, top_n)
+
+def print_latency(latencies):
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    over = int((values > TIME_LIMIT * 1000).sum())
+    print("⏱️  Per-case latency:")
+    print(f"  p50: {p50:.2f}ms  p95: {p95:.2f}ms  p99: {p99:.2f}ms  max: {values.max():.2f}ms")
+    print(f"  Over {TIME_LIMIT:g}s limit: {over} ({round(over / len(values) * 100, 1)}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the reimbursement implementation against the public cases.")
+    parser.add_argument("--mode", choices=["batch", "function", "subprocess"], default="batch",
+                        help="batch: one vectorized call; function: one in-process call per case; "
+                             "subprocess: one process per case via --command")
+    parser.add_argument("--command", default="python run.py",
+                        help="command run per case in subprocess mode, e.g. ./run.sh (default: python run.py)")
+    parser.add_argument("--predictor", choices=sorted(PREDICTORS), default="run",
+                        help="in-process implementation: run (pattern buckets) or knn (nearest-neighbour index)")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes to shard the cases across")
+    parser.add_argument("--top", type=int, default=5, help="number of highest-error cases to show")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute batch predictions even if the implementation and cases are unchanged")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="record which path resolved each case and write the metrics (.prom for Prometheus "
+                             "text); predictions are recomputed rather than read from the cache")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        profiling.start(args.profile, args.profile_trace, "eval.py")
+    try:
+        evaluate(args)
+    finally:
+        if args.profile:
+            profiling.finish()
+
+def evaluate(args):
+    print("🧾 Black Box Challenge - Reimbursement System Evaluation")
+    print("=======================================================\n")
+
+    try:
+        with profiling.phase("parse cases") as parsed:
+            cases = load_cases(CASES_PATH)
+            parsed.rows = len(cases)
+    except FileNotFoundError:
+        print("❌ Error: public_cases.json not found!")
+        return
+
+    num_cases = len(cases)
+    print(f"📊 Running evaluation against {num_cases} test cases...\n")
+
+    # Batch predictions are cached per implementation fingerprint and case file
+    fingerprint = cached = None
+    if args.mode == "batch" and not args.no_cache:
+        with profiling.phase("load cache"):
+            fingerprint = eval_cache.fingerprint(args.predictor, CASES_PATH)
+            cached = None if args.metrics else eval_cache.load_predictions(fingerprint)
+        if cached is not None:
+            print(f"♻️  Implementation unchanged ({fingerprint[:12]}), reusing cached predictions\n")
+
+    started = time.perf_counter()
+    with profiling.phase("score", rows=num_cases):
+        stats = score_cases(cases, args.mode, shlex.split(args.command), args.jobs, args.top, args.predictor, cached)
+    wall_time = time.perf_counter() - started
+
+    if fingerprint is not None:
+        with profiling.phase("save cache"):
+            if cached is None and not stats["errors"]:
+                eval_cache.save_predictions(fingerprint, stats["outputs"], args.predictor, CASES_PATH)
+            if cached is not None or not stats["errors"]:
+                eval_cache.record_run(fingerprint, args.predictor, CASES_PATH)
+
+    if stats["latencies"]:
+        print(f"⏱️  Wall time: {wall_time:.2f}s ({num_cases / wall_time:.0f} cases/s, {args.mode} mode, {args.jobs} job(s))")
+    print_report(stats, num_cases, args.top)
+    if args.metrics:
+        metrics.export(args.metrics)
+        print(f"📊 Metrics saved to {args.metrics}")
+
+    if fingerprint is not None:
+        with profiling.phase("diff previous run"):
+            previous = eval_cache.previous_run(fingerprint, args.predictor, CASES_PATH)
+        if previous is not None and len(previous[1]) == num_cases:
+            print_diff(previous[0], eval_cache.diff_predictions(previous[1], stats["outputs"], cases.expected),
+                       cases, previous[1], stats["outputs"], args.top)
+
+def print_diff(previous_fingerprint, diff, cases, previous, current, top_n=5):
+    """Per-case comparison against the previous implementation's run."""
+    print(f"\n🔁 Compared with previous run ({previous_fingerprint[:12]}):")
+    print(f"  Improved: {len(diff['improved'])}  Regressed: {len(diff['regressed'])}  "
+          f"Unchanged: {len(diff['unchanged'])}")
+    regressed = diff["regressed"][np.argsort(-diff["delta"][diff["regressed"]], kind="stable")][:top_n]
+    for i in regressed.tolist():
+        print(f"    Case {i + 1}: {plain_number(cases.days[i].item())} days, "
+              f"{plain_number(cases.miles[i].item())} miles, ${cases.receipts[i]} receipts")
+        print(f"      Expected: ${cases.expected[i]:.2f}, Was: ${previous[i]:.2f}, "
+              f"Now: ${current[i]:.2f} (error +${diff['delta'][i]:.2f})")
+
+def summarize(stats, num_cases):
+    """The headline figures of print_report; stats must have at least one successful run."""
+    successful_runs = stats["successful_runs"]
+    avg_error = stats["total_error"] / successful_runs
+    return {
+        "avg_error": avg_error,
+        "exact_pct": round((stats["exact_matches"] / successful_runs) * 100, 1),
+        "close_pct": round((stats["close_matches"] / successful_runs) * 100, 1),
+        "score": round(avg_error * 100 + (num_cases - stats["exact_matches"]) * 0.1, 2),
+    }
+
+def print_report(stats, num_cases, top_n=5):
+    successful_runs = stats["successful_runs"]
+    exact_matches = stats["exact_matches"]
+    close_matches = stats["close_matches"]
+    total_error = stats["total_error"]
+    max_error = stats["max_error"]
+    errors = stats["errors"]
 
     if successful_runs == 0:
         print("❌ No successful test cases!")
         print("Your script may have failed, produced invalid output, or timed out.")
         return
 
-    avg_error = total_error / successful_runs
-    exact_pct = round((exact_matches / successful_runs) * 100, 1)
-    close_pct = round((close_matches / successful_runs) * 100, 1)
-    score = round(avg_error * 100 + (num_cases - exact_matches) * 0.1, 2)
+    summary = summarize(stats, num_cases)
+    avg_error, exact_pct, close_pct, score = (summary[k] for k in ("avg_error", "exact_pct", "close_pct", "score"))
 
     print("\n✅ Evaluation Complete!\n")
     print("📈 Results Summary:")
@@ -86,6 +312,10 @@ def main():
     print(f"  Maximum error: ${max_error:.2f}")
     print(f"\n🎯 Your Score: {score} (lower is better)\n")
 
+    if stats["latencies"]:
+        print_latency(stats["latencies"])
+        print()
+
     if exact_matches == num_cases:
         print("🏆 PERFECT SCORE! You have reverse-engineered the system completely!")
     elif exact_matches > 950:
@@ -97,12 +327,11 @@ def main():
     else:
         print("📚 Keep analyzing the patterns in the interviews and test cases.")
 
-    # Top 5 highest-error cases
+    # Top N highest-error cases
     if exact_matches < num_cases:
         print("\n💡 Tips for improvement:")
         print("  Check these high-error cases:")
-        top_errors = sorted(results, key=lambda x: -x["error"])[:5]
-        for res in top_errors:
+        for res in stats["top_errors"][:top_n]:
             print(f"    Case {res['case_num']}: {res['trip_days']} days, {res['miles']} miles, ${res['receipts']} receipts")
             print(f"      Expected: ${res['expected']:.2f}, Got: ${res['actual']:.2f}, Error: ${res['error']:.2f}")
 
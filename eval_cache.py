@@ -0,0 +1,109 @@
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from cases import ingested_path
+from snapshot import SNAPSHOT_DIR, file_sha256, read_snapshot, write_snapshot
+
+CACHE_DIR = os.path.join(SNAPSHOT_DIR, "eval")
+HISTORY_PATH = os.path.join(CACHE_DIR, "history.json")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that score predictions but don't produce them
+_EXCLUDED_MODULES = {"__main__", "__mp_main__", "eval", "eval_cache", "aggregate", "visualize",
+                     "profiling"}
+
+# Modules each predictor imports only on first use, which may not be loaded yet when it's fingerprinted
+PREDICTOR_MODULES = {
+    "run": ("run", "lookup_tables"),
+    "knn": ("run", "lookup_tables", "neighbors"),
+}
+
+def implementation_sources():
+    """Source files of the repo modules currently imported, excluding the evaluator itself."""
+    paths = set()
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if name in _EXCLUDED_MODULES or not path or not path.endswith(".py"):
+            continue
+        if os.path.dirname(os.path.abspath(path)) == REPO_DIR:
+            paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+def fingerprint(predictor, cases_path, tables_path="public_cases.json"):
+    """Hash of the scoring implementation, the case file and the tables' source data (with ingested cases)."""
+    for name in PREDICTOR_MODULES.get(predictor, ()):
+        importlib.import_module(name)
+    digest = hashlib.sha256()
+    digest.update(predictor.encode())
+    digest.update(np.__version__.encode())
+    for path in implementation_sources():
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_sha256(path).encode())
+    digest.update(file_sha256(tables_path).encode())
+    if os.path.exists(ingested_path(tables_path)):
+        digest.update(file_sha256(ingested_path(tables_path)).encode())
+    digest.update(file_sha256(cases_path).encode())
+    return digest.hexdigest()
+
+def _path(key):
+    return os.path.join(CACHE_DIR, f"{key[:32]}.predictions")
+
+def load_predictions(key):
+    """Stored predictions for a fingerprint, or None."""
+    try:
+        header, arrays = read_snapshot(_path(key))
+    except (OSError, ValueError):
+        return None
+    if header.get("fingerprint") != key:
+        return None
+    return arrays["outputs"]
+
+def _read_history():
+    try:
+        with open(HISTORY_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def save_predictions(key, outputs, predictor, cases_path):
+    """Store predictions for a fingerprint; record_run adds the run to the history used for diffs."""
+    write_snapshot(_path(key), {"outputs": np.asarray(outputs, dtype=np.float64)},
+                   {"fingerprint": key, "predictor": predictor, "cases": os.path.basename(cases_path)})
+
+def record_run(key, predictor, cases_path):
+    history = _read_history()
+    entry = {"fingerprint": key, "predictor": predictor,
+             "cases_sha256": file_sha256(cases_path), "time": time.time()}
+    history = [h for h in history if h["fingerprint"] != key] + [entry]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{HISTORY_PATH}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(history[-200:], f)
+    os.replace(tmp, HISTORY_PATH)
+
+def previous_run(key, predictor, cases_path):
+    """(fingerprint, predictions) of the latest other run of this predictor on the same cases."""
+    cases_sha = file_sha256(cases_path)
+    for entry in reversed(_read_history()):
+        if (entry["fingerprint"] != key and entry["predictor"] == predictor
+                and entry["cases_sha256"] == cases_sha):
+            outputs = load_predictions(entry["fingerprint"])
+            if outputs is not None:
+                return entry["fingerprint"], outputs
+    return None
+
+def diff_predictions(previous, current, expected, tolerance=0.005):
+    """Per-case comparison of absolute errors: index arrays of improved, regressed and unchanged cases."""
+    delta = np.abs(current - expected) - np.abs(previous - expected)
+    return {
+        "improved": np.flatnonzero(delta < -tolerance),
+        "regressed": np.flatnonzero(delta > tolerance),
+        "unchanged": np.flatnonzero(np.abs(delta) <= tolerance),
+        "delta": delta,
+    }
@@ -0,0 +1,152 @@
+from array import array
+
+import numpy as np
+
+from snapshot import read_snapshot, write_snapshot
+
+# Rows per block in batch traversal, so (trees x rows) node arrays stay small
+BLOCK_CELLS = 4_000_000
+
+def _combinations(powers):
+    """Input columns multiplied together for each PolynomialFeatures output, padded with -1."""
+    combos = [[i for i, p in enumerate(row) for _ in range(p)] for row in powers.tolist()]
+    width = max((len(c) for c in combos), default=0)
+    return np.array([c + [-1] * (width - len(c)) for c in combos], dtype=np.int64).reshape(len(combos), width)
+
+def compile_pipeline(pipeline):
+    """Flatten make_pipeline(PolynomialFeatures, RandomForestRegressor) into plain arrays.
+
+    Node arrays of all trees are concatenated; left/right hold global node
+    indices and are -1 at leaves; roots holds each tree's first node.
+    """
+    poly, forest = pipeline.steps[0][1], pipeline.steps[-1][1]
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left < 0
+        feature.append(np.where(leaf, -1, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(leaf, -1, tree.children_left + offset))
+        right.append(np.where(leaf, -1, tree.children_right + offset))
+        value.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+    combinations = _combinations(poly.powers_)
+    # Snapshots hold 1-D arrays; combinations are stored flat with their width
+    return {
+        "combinations": combinations.ravel(),
+        "combination_width": np.array([combinations.shape[1]], dtype=np.int64),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int64),
+        "max_depth": np.array([depth], dtype=np.int64),
+    }
+
+class CompiledForest:
+    """Array-based evaluator for a compiled polynomial + random forest pipeline.
+
+    Reproduces pipeline.predict exactly: features are expanded in float64,
+    cast to float32 as sklearn's trees do, compared with `<=` against the
+    float64 thresholds, and tree outputs are summed in tree order before
+    dividing by the number of trees. Inputs must not contain NaN.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.combinations = arrays["combinations"].reshape(-1, int(arrays["combination_width"][0]))
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"][0])
+        self._lists = None
+
+        # Batch traversal form: leaves loop back to themselves (split on feature 0
+        # at +inf), so every row can take max_depth steps without leaf checks
+        leaf = self.left < 0
+        nodes = np.arange(len(self.left), dtype=np.intp)
+        self._split = np.where(leaf, 0, self.feature).astype(np.intp)
+        self._threshold = np.where(leaf, np.inf, self.threshold)
+        self._children = np.stack([np.where(leaf, nodes, self.left), np.where(leaf, nodes, self.right)],
+                                  axis=1).ravel().astype(np.intp)
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        return cls(compile_pipeline(pipeline))
+
+    def save(self, path, metadata):
+        write_snapshot(path, self.arrays, metadata)
+
+    @classmethod
+    def load(cls, path):
+        header, arrays = read_snapshot(path)
+        return header, cls(arrays)
+
+    def transform(self, X):
+        """Polynomial features of X as float32, the dtype the trees compare."""
+        out = np.ones((len(X), len(self.combinations)))
+        for j, combo in enumerate(self.combinations.tolist()):
+            columns = [i for i in combo if i >= 0]
+            if columns:
+                product = X[:, columns[0]]
+                for i in columns[1:]:
+                    product = product * X[:, i]
+                out[:, j] = product
+        return out.astype(np.float32)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if len(X) == 1:
+            return np.array([self.predict_one(*X[0].tolist())])
+        step = max(1, BLOCK_CELLS // max(len(self.roots), 1))
+        return np.concatenate([self._predict_block(X[lo:lo + step]) for lo in range(0, len(X), step)])
+
+    def _predict_block(self, X):
+        features = self.transform(X).T.ravel()
+        n = len(X)
+        rows = np.arange(n)
+        # Offsets of each node's split column in the flattened (feature, row) matrix
+        split_offset = self._split * n
+        node = np.repeat(self.roots.astype(np.intp)[:, None], n, axis=1)
+        for _ in range(self.max_depth):
+            x = features.take(split_offset.take(node) + rows)
+            go_right = (x > self._threshold.take(node)).view(np.int8)
+            node = self._children.take(2 * node + go_right)
+        leaf_values = self.value.take(node)
+        total = np.zeros(n)
+        for tree_values in leaf_values:
+            total += tree_values
+        return total / len(self.roots)
+
+    def predict_one(self, *row):
+        """Scalar predict for one input row, in plain Python."""
+        if self._lists is None:
+            # Memoryviews index as fast as lists but read the (memory-mapped) arrays in place, so
+            # processes forked after the first call share them instead of copying refcounted objects
+            self._lists = (memoryview(self.feature), memoryview(self.threshold), memoryview(self.left),
+                           memoryview(self.right), memoryview(self.value), self.roots.tolist(),
+                           [[i for i in c if i >= 0] for c in self.combinations.tolist()])
+        feature, threshold, left, right, value, roots, combos = self._lists
+        expanded = []
+        for columns in combos:
+            product = 1.0
+            for n, i in enumerate(columns):
+                product = row[i] if n == 0 else product * row[i]
+            expanded.append(product)
+        x = array("f", expanded).tolist()
+
+        total = 0.0
+        for node in roots:
+            while left[node] >= 0:
+                node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+            total += value[node]
+        return total / len(roots)
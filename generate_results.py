@@ -1,36 +1,127 @@
-import json
-from run import calculate_reimbursement
+import argparse
+from itertools import islice
+
+import numpy as np
+
+import memo
+import metrics
+import profiling
+from cases import CaseSet, iter_cases, load_cases
+from run import calculate_reimbursement, calculate_reimbursement_batch
 
 def load_private_cases():
-    with open("private_cases.json") as f:
-        return json.load(f)
+    return load_cases("private_cases.json")
 
-def main():
-    cases = load_private_cases()
+def score_chunk(cases, offset=0, progress=True):
+    """Return the formatted result lines for a CaseSet; malformed cases get "ERROR"."""
     results = []
+    invalid = cases.invalid.astype(bool)
+    scored = cases.filter(~invalid) if invalid.any() else cases
 
-    print(f"🧾 Generating results for {len(cases)} cases...")
+    # Compute each distinct input once in one batch; fall back to per-case calls if the batch fails.
+    # With metrics on every row goes through the batch, so path counts cover all cases
+    try:
+        if metrics.enabled:
+            outputs = calculate_reimbursement_batch(*scored.columns())
+        else:
+            outputs = memo.dedupe(calculate_reimbursement_batch, *scored.columns())
+        if scored is not cases:
+            outputs, scored_outputs = np.full(len(cases), np.nan), outputs
+            outputs[~invalid] = scored_outputs
+    except Exception:
+        outputs = None
 
-    for i, case in enumerate(cases):
-        trip_days = case["trip_duration_days"]
-        miles = case["miles_traveled"]
-        receipts = case["total_receipts_amount"]
+    for j in range(len(cases)):
+        i = offset + j
 
         try:
-            result = calculate_reimbursement(trip_days, miles, receipts)
+            if invalid[j]:
+                raise ValueError("malformed case")
+            if outputs is not None:
+                result = outputs[j]
+            else:
+                result = calculate_reimbursement(cases.days[j].item(), cases.miles[j].item(),
+                                                 cases.receipts[j].item())
             results.append(f"{result:.2f}")
         except Exception:
             results.append("ERROR")
             print(f"❌ Error on case {i+1}")
 
-        if (i + 1) % 100 == 0:
+        if progress and (i + 1) % 100 == 0:
             print(f"Processed {i+1} cases...")
 
-    with open("private_results.txt", "w") as f:
-        for r in results:
-            f.write(r + "\n")
+    return results
+
+def stream_results(input_path, output_path, chunk_size=100_000):
+    """Score cases in bounded chunks, appending each chunk's results as soon as it is done."""
+    print(f"🧾 Streaming results for {input_path} in chunks of {chunk_size}...")
+
+    cases = iter_cases(input_path)
+    processed = 0
+    with open(output_path, "w") as f:
+        while True:
+            with profiling.phase("parse cases") as parsed:
+                chunk = list(islice(cases, chunk_size))
+                if chunk:
+                    chunk = CaseSet.from_records(chunk)
+                parsed.rows = len(chunk)
+            if not len(chunk):
+                break
+            with profiling.phase("score", rows=len(chunk)):
+                results = score_chunk(chunk, processed, progress=False)
+            with profiling.phase("write results", rows=len(chunk)):
+                f.write("".join(r + "\n" for r in results))
+                f.flush()
+            processed += len(chunk)
+            print(f"Processed {processed} cases...")
+
+    print(f"✅ Results saved to {output_path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate results for the private cases.")
+    parser.add_argument("--stream", action="store_true",
+                        help="read JSON-array or NDJSON input incrementally and write results in chunks")
+    parser.add_argument("--input", default="private_cases.json", help="case file (default: private_cases.json)")
+    parser.add_argument("--output", default="private_results.txt", help="results file (default: private_results.txt)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="cases per chunk in --stream mode")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="record which path resolved each case and write the metrics (.prom for Prometheus text)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        profiling.start(args.profile, args.profile_trace, "generate_results.py")
+    try:
+        generate(args)
+    finally:
+        if args.metrics:
+            metrics.export(args.metrics)
+            print(f"📊 Metrics saved to {args.metrics}")
+        if args.profile:
+            profiling.finish()
+
+def generate(args):
+    if args.stream:
+        stream_results(args.input, args.output, args.chunk_size)
+        return
+
+    with profiling.phase("parse cases") as parsed:
+        cases = load_cases(args.input)
+        parsed.rows = len(cases)
+
+    print(f"🧾 Generating results for {len(cases)} cases...")
+
+    with profiling.phase("score", rows=len(cases)):
+        results = score_chunk(cases)
+
+    with profiling.phase("write results", rows=len(results)):
+        with open(args.output, "w") as f:
+            for r in results:
+                f.write(r + "\n")
 
-    print("✅ Results saved to private_results.txt")
+    print(f"✅ Results saved to {args.output}")
 
 if __name__ == "__main__":
     main()
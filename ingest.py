@@ -0,0 +1,117 @@
+import argparse
+import fcntl
+import json
+import os
+import sys
+import time
+
+from cases import CaseSet, ingested_path, iter_cases
+from lookup_tables import append_snapshot, compile_snapshot, read_current_snapshot
+from private_run import EXTRA_TREES
+from snapshot import cache_path
+
+def _append_log(log, records):
+    """Append records to the NDJSON log in one write, fsynced before returning.
+
+    A crash mid-write can leave at most a partial last line, which loading
+    skips; it is cut off here before the next append.
+    """
+    data = "".join(json.dumps(record) + "\n" for record in records).encode()
+    with open(log, "a+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.truncate(_last_line_end(f, size))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _last_line_end(f, size, block_size=1 << 16):
+    """Offset just past the last newline of the file (0 if it has none)."""
+    pos = size
+    while pos > 0:
+        step = min(pos, block_size)
+        pos -= step
+        f.seek(pos)
+        newline = f.read(step).rfind(b"\n")
+        if newline >= 0:
+            return pos + newline + 1
+    return 0
+
+def _predictor_for(source):
+    import private_run
+    if os.path.abspath(private_run.predictor.cases_path) == os.path.abspath(source):
+        return private_run.predictor
+    return private_run.ReimbursementPredictor(source)
+
+def append_cases(records, source="public_cases.json", extra_trees=EXTRA_TREES, model=True):
+    """Add new historical cases to source without rebuilding from scratch.
+
+    The records (public-case format, with expected_output) are appended to
+    source's ingest log, folded into the lookup snapshot, and, with model,
+    used to grow the forest by extra_trees warm-started trees. A snapshot that
+    was already stale is rebuilt in full instead. Returns timings.
+    """
+    records = list(records)
+    cases = CaseSet.from_records(records)
+    if not len(cases):
+        return {"cases": 0}
+    if cases.invalid.any():
+        raise ValueError(f"malformed case at position {int(cases.invalid.argmax()) + 1}")
+    if not cases.has_expected:
+        raise ValueError("every ingested case needs an expected_output")
+
+    log = ingested_path(source)
+    stats = {"cases": len(cases)}
+    lock_path = cache_path(log, ".lock")
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Both the tables and the pipeline must describe the data as it was before this batch
+        current = read_current_snapshot(source)
+        if model:
+            predictor = _predictor_for(source)
+            pipeline = predictor.load_pipeline()
+        _append_log(log, records)
+
+        started = time.perf_counter()
+        if current is None:
+            compile_snapshot(source)
+            stats["rebuilt"] = True
+        else:
+            append_snapshot(source, *current, cases)
+        stats["tables_seconds"] = time.perf_counter() - started
+
+        if model:
+            started = time.perf_counter()
+            predictor.grow(pipeline, extra_trees)
+            stats["model_seconds"] = time.perf_counter() - started
+            stats["trees"] = len(pipeline.steps[-1][1].estimators_)
+
+    run = sys.modules.get("run")
+    if run is not None and os.path.abspath(source) == os.path.abspath("public_cases.json"):
+        run.refresh_lookup_tables()
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append new historical cases to the lookup tables and model.")
+    parser.add_argument("cases", help="JSON array or NDJSON file of cases with expected outputs")
+    parser.add_argument("--source", default="public_cases.json", help="case file the new cases extend")
+    parser.add_argument("--trees", type=int, default=EXTRA_TREES, help="trees added to the forest for this batch")
+    parser.add_argument("--no-model", action="store_true",
+                        help="only update the lookup tables; the model retrains on next load")
+    args = parser.parse_args(argv)
+
+    stats = append_cases(iter_cases(args.cases), args.source, args.trees, model=not args.no_model)
+    if not stats["cases"]:
+        print(f"❌ No cases in {args.cases}")
+        return
+    how = "rebuilt" if stats.get("rebuilt") else "updated"
+    print(f"✅ Appended {stats['cases']} cases to {ingested_path(args.source)}")
+    print(f"📇 Lookup tables {how} in {stats['tables_seconds'] * 1000:.1f} ms")
+    if "model_seconds" in stats:
+        print(f"🌲 Forest grown to {stats['trees']} trees in {stats['model_seconds']:.2f}s")
+
+if __name__ == "__main__":
+    main()
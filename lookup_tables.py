@@ -0,0 +1,253 @@
+import os
+
+import numpy as np
+
+import profiling
+from cases import load_training_cases
+from packed_table import (CENTS_BITS, DAYS_BITS, MILES_BITS, PackedTable, delta_path, delta_seqs,
+                          load_lookup_tables, merge_layers, read_current_snapshot, snapshot_path, tables_from_snapshot)
+from snapshot import ingested_path, source_info, write_snapshot
+
+# Ingested batches are written as delta segments beside the snapshot. Past MAX_DELTAS segments
+# they're compacted into one, and once they hold more than DELTA_SHARE of the snapshot's keys
+# they're merged into it, so each rewrite of the full table is paid for by that many new keys
+MAX_DELTAS = 8
+DELTA_SHARE = 0.25
+
+# Columns of each table, stored as <table>_<column>
+_COLUMNS = {"exact": ("keys", "values", "integral"), "pattern": ("keys", "sums", "counts", "values")}
+
+def round2(values):
+    """Vectorized round(x, 2) matching Python's correctly rounded builtin."""
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    with np.errstate(invalid="ignore"):
+        rounded = np.rint(scaled) / 100
+        frac = np.abs(scaled - np.trunc(scaled))
+        tolerance = np.maximum(1e-6, np.abs(scaled) * 1e-15)
+        # Products that land near .5 may round differently from the exact decimal
+        ambiguous = ~np.isfinite(scaled) | (np.abs(frac - 0.5) < tolerance)
+    flat_values, flat_rounded = values.reshape(-1), rounded.reshape(-1)
+    for i in np.flatnonzero(ambiguous):
+        flat_rounded[i] = round(float(flat_values[i]), 2)
+    return rounded
+
+def pack_keys(days, miles, amounts):
+    """Pack (days, miles, dollar amount) columns into int64 keys, with a mask of packable rows.
+
+    days and miles must be non-negative integers and amounts a whole number of cents;
+    anything else (or out of range) is reported as unpackable.
+    """
+    with np.errstate(invalid="ignore"):
+        cents = np.rint(amounts * 100)
+        valid = ((days == np.floor(days)) & (days >= 0) & (days < 2 ** DAYS_BITS) &
+                 (miles == np.floor(miles)) & (miles >= 0) & (miles < 2 ** MILES_BITS) &
+                 (cents / 100 == amounts) & (cents >= 0) & (cents < 2 ** CENTS_BITS))
+    packed = np.zeros(len(days), dtype=np.int64)
+    packed[valid] = ((days[valid].astype(np.int64) << (MILES_BITS + CENTS_BITS)) |
+                     (miles[valid].astype(np.int64) << CENTS_BITS) |
+                     cents[valid].astype(np.int64))
+    return packed, valid
+
+def unpack_keys(packed):
+    """Inverse of pack_keys: (days, miles, amount) columns of packed keys."""
+    packed = np.asarray(packed, dtype=np.int64)
+    days = packed >> (MILES_BITS + CENTS_BITS)
+    miles = (packed >> CENTS_BITS) & ((1 << MILES_BITS) - 1)
+    cents = packed & ((1 << CENTS_BITS) - 1)
+    return days, miles, cents / 100
+
+def exact_keys(days, miles, receipts):
+    return pack_keys(days, np.rint(miles), round2(receipts))
+
+def pattern_keys(days, miles, receipts):
+    """The two pattern-bucket keys for each row, as (key1, valid1, key2, valid2)."""
+    key1, valid1 = pack_keys(days, np.rint(miles / 50) * 50, np.rint(receipts / 100) * 100)
+    key2, valid2 = pack_keys(np.rint(days / 2) * 2, np.rint(miles / 100) * 100, np.rint(receipts / 50) * 50)
+    return key1, valid1, key2, valid2
+
+def build_arrays(days, miles, receipts, outputs, integral=None):
+    """Build the snapshot arrays for the exact and pattern tables from case columns.
+
+    Mirrors the dict-based tables: later cases overwrite earlier exact keys, and
+    pattern buckets average their outputs in case order. integral flags outputs
+    that were integer literals, so exact matches return them as ints.
+    """
+    return delta_arrays([], {"exact": {}, "pattern": {}}, days, miles, receipts, outputs, integral)
+
+def _newest(layers, table, keys, columns):
+    """Columns of each key's row in the newest of layers (oldest first) that has it, zero where none does."""
+    found = {name: np.zeros(len(keys), dtype=dtype) for name, dtype in columns.items()}
+    for layer in layers:
+        table_keys = np.asarray(layer[f"{table}_keys"])
+        if not len(table_keys):
+            continue
+        idx = np.minimum(np.searchsorted(table_keys, keys), len(table_keys) - 1)
+        hit = table_keys[idx] == keys
+        for name in columns:
+            found[name][hit] = np.asarray(layer[f"{table}_{name}"])[idx[hit]]
+    return found
+
+def delta_arrays(layers, overflow, days, miles, receipts, outputs, integral=None):
+    """Snapshot arrays of the keys more cases add or change, as if they came last in the case file.
+
+    layers are the current snapshot arrays and delta segments, oldest first.
+    Exact keys take the cases' last output, and pattern sums carry on from the
+    newest layer's in case order, so layering the result over them is
+    bit-identical to build_arrays over all the cases. Returns the new layer and
+    the whole overflow; the inputs are not modified.
+    """
+    days = np.asarray(days, dtype=np.float64)
+    miles = np.asarray(miles, dtype=np.float64)
+    receipts = np.asarray(receipts, dtype=np.float64)
+    outputs = np.asarray(outputs, dtype=np.float64)
+    if integral is None:
+        integral = np.zeros(len(outputs), dtype=np.uint8)
+    integral = np.asarray(integral, dtype=np.uint8)
+
+    # Exact table: keep the last occurrence of each key
+    keys, valid = exact_keys(days, miles, receipts)
+    rows = np.flatnonzero(valid)
+    order = rows[np.argsort(keys[rows], kind="stable")]
+    sorted_keys = keys[order]
+    last = np.r_[sorted_keys[1:] != sorted_keys[:-1], True] if len(order) else np.zeros(0, dtype=bool)
+    exact_overflow = dict(overflow["exact"])
+    for i in np.flatnonzero(~valid):
+        key = (_py(days[i]), round(miles[i]), round(float(receipts[i]), 2))
+        exact_overflow[key] = _py(outputs[i]) if integral[i] else float(outputs[i])
+
+    # Pattern table: interleave key1/key2 per case so sums accumulate in case order
+    key1, valid1, key2, valid2 = pattern_keys(days, miles, receipts)
+    keys = np.stack([key1, key2], axis=1).ravel()
+    valid = np.stack([valid1, valid2], axis=1).ravel()
+    values = np.repeat(outputs, 2)
+    pattern_table_keys = np.unique(keys[valid])
+    base = _newest(layers, "pattern", pattern_table_keys, {"sums": np.float64, "counts": np.int64})
+    sums, counts = base["sums"], base["counts"]
+    idx = np.searchsorted(pattern_table_keys, keys[valid])
+    np.add.at(sums, idx, values[valid])
+    np.add.at(counts, idx, 1)
+    pattern_overflow = {key: list(bucket) for key, bucket in overflow["pattern"].items()}
+    for j in np.flatnonzero(~valid):
+        i = j // 2
+        if j % 2 == 0:
+            key = (_py(days[i]), round(miles[i] / 50) * 50, round(receipts[i] / 100) * 100)
+        else:
+            key = (round(days[i] / 2) * 2, round(miles[i] / 100) * 100, round(receipts[i] / 50) * 50)
+        bucket = pattern_overflow.setdefault(key, [0, 0])
+        bucket[0] += _py(outputs[i])
+        bucket[1] += 1
+
+    arrays = {
+        "exact_keys": sorted_keys[last],
+        "exact_values": outputs[order][last],
+        "exact_integral": integral[order][last],
+        "pattern_keys": pattern_table_keys,
+        "pattern_sums": sums,
+        "pattern_counts": counts,
+        "pattern_values": sums / np.maximum(counts, 1),
+    }
+    return arrays, {"exact": exact_overflow, "pattern": pattern_overflow}
+
+def merge_arrays(layers):
+    """The snapshot arrays of layers (oldest first) merged into one, each key keeping its newest row."""
+    arrays = {}
+    for table, columns in _COLUMNS.items():
+        merged = merge_layers([{name: layer[f"{table}_{name}"] for name in columns} for layer in layers])
+        arrays.update((f"{table}_{name}", column) for name, column in merged.items())
+    return arrays
+
+def effective_arrays(arrays, deltas):
+    """The snapshot arrays with its delta segments merged in, as a full rebuild would write them."""
+    return merge_arrays([arrays, *(a for _, a in deltas)]) if deltas else arrays
+
+def _py(value):
+    value = float(value)
+    return int(value) if value == int(value) else value
+
+def _ingested_info(source):
+    log = ingested_path(source)
+    return source_info(log) if os.path.exists(log) else None
+
+def _overflow_json(overflow):
+    # Overflow keys are rare (negative or out-of-range inputs); keep them as JSON
+    return {name: [[list(k), v] for k, v in table.items()] for name, table in overflow.items()}
+
+def _overflow_from_json(overflow):
+    return {"exact": {tuple(k): v for k, v in overflow.get("exact", [])},
+            "pattern": {tuple(k): v for k, v in overflow.get("pattern", [])}}
+
+def _generation():
+    # Delta segments record the snapshot they were layered on; a rewritten snapshot orphans them
+    return os.urandom(8).hex()
+
+def _remove_deltas(path, below=None):
+    """Delete the delta segments of a snapshot (those numbered below `below`, if given)."""
+    for seq in delta_seqs(path):
+        if below is None or seq < below:
+            try:
+                os.remove(delta_path(path, seq))
+            except FileNotFoundError:
+                pass
+
+def _rows(layers):
+    return sum(len(layer["exact_keys"]) + len(layer["pattern_keys"]) for layer in layers)
+
+def compile_snapshot(source, path=None):
+    """Load the case file plus its ingested cases and write their lookup snapshot."""
+    path = path or snapshot_path(source)
+    info, ingested = source_info(source), _ingested_info(source)
+    with profiling.phase("parse cases") as parsed:
+        cases = load_training_cases(source)
+        parsed.rows = len(cases)
+    with profiling.phase("build arrays", rows=len(cases)):
+        arrays, overflow = build_arrays(cases.days, cases.miles, cases.receipts,
+                                        cases.expected, cases.expected_is_int)
+    with profiling.phase("write snapshot"):
+        write_snapshot(path, arrays, {"source": info, "ingested": ingested, "overflow": _overflow_json(overflow),
+                                      "generation": _generation()})
+        _remove_deltas(path)
+    return path
+
+def append_snapshot(source, header, arrays, deltas, cases, path=None):
+    """Fold cases into the lookup snapshot, after they were appended to the ingest log.
+
+    header, arrays and deltas must be the snapshot that was current before the
+    append. The cases' keys go into a new delta segment, so an append writes
+    the size of the batch rather than of the table; see MAX_DELTAS and
+    DELTA_SHARE for when segments are compacted or merged into the snapshot.
+    """
+    path = path or snapshot_path(source)
+    layers = [arrays, *(a for _, a in deltas)]
+    newest = deltas[-1][0] if deltas else header
+    delta, overflow = delta_arrays(layers, _overflow_from_json(newest.get("overflow", {})),
+                                   cases.days, cases.miles, cases.receipts, cases.expected, cases.expected_is_int)
+    metadata = {"ingested": _ingested_info(source), "overflow": _overflow_json(overflow)}
+
+    if header.get("generation") is None or _rows(layers[1:] + [delta]) > _rows([arrays]) * DELTA_SHARE:
+        write_snapshot(path, merge_arrays(layers + [delta]), dict(header, generation=_generation(), **metadata))
+        _remove_deltas(path)
+        return path
+    base = newest.get("seq", 0)
+    if len(deltas) + 1 >= MAX_DELTAS:
+        delta, base = merge_arrays(layers[1:] + [delta]), 0
+    seq = max(delta_seqs(path), default=0) + 1
+    write_snapshot(delta_path(path, seq), delta, dict(metadata, generation=header["generation"], seq=seq, base=base))
+    if not base:
+        _remove_deltas(path, below=seq)
+    return path
+
+def build_tables(days, miles, receipts, outputs, integral=None):
+    """(exact_lookup, pattern_lookup) for case columns, in memory without a snapshot."""
+    arrays, overflow = build_arrays(days, miles, receipts, outputs, integral)
+    return tables_from_snapshot({"overflow": _overflow_json(overflow)}, arrays)
+
+def build_source_tables(source):
+    """(exact_lookup, pattern_lookup) for a case file plus its ingested cases, without writing a snapshot."""
+    cases = load_training_cases(source)
+    return build_tables(cases.days, cases.miles, cases.receipts, cases.expected, cases.expected_is_int)
+
+if __name__ == "__main__":
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else "public_cases.json"
+    print(f"✅ Wrote {compile_snapshot(source)}")
@@ -0,0 +1,138 @@
+import functools
+import os
+import weakref
+
+ENV_VAR = "REIMBURSEMENT_CACHE_SIZE"
+
+def cache_size(default):
+    """Entries to keep per memoized function: REIMBURSEMENT_CACHE_SIZE if set (0 disables caching), else default."""
+    return int(os.environ.get(ENV_VAR, default))
+
+CACHE_SIZE = cache_size(65536)
+
+_caches = {}
+_dedupe = {"calls": 0, "rows": 0, "unique": 0}
+
+# Deduplicate a batch only when an estimated share of its rows at least this large repeats an
+# earlier row: below it, sorting the batch costs more than scoring the repeats
+DEDUPE_MIN_SAVING = 0.25
+DEDUPE_SAMPLE = 1024
+
+# numpy is imported inside the batch helpers below: run.py's one-shot CLI only needs lru()
+
+# Odd 64-bit multipliers for hashing the bit patterns of a row
+_HASH_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+def lru(name, maxsize=None):
+    """functools.lru_cache, registered under name so stats() can report it.
+
+    Keys are typed, so 3 and 3.0 are cached separately and a hit returns
+    exactly what an uncached call with the same argument types would.
+    Each cache made under a name (e.g. one per predictor instance) is
+    registered weakly, so the registry never keeps an instance alive.
+    """
+    def decorate(fn):
+        cached = functools.lru_cache(maxsize=CACHE_SIZE if maxsize is None else maxsize, typed=True)(fn)
+        _caches.setdefault(name, weakref.WeakSet()).add(cached)
+        return cached
+    return decorate
+
+def stats():
+    """Hit/miss counts of every registered cache, summed over the live caches of each name,
+    plus batch deduplication totals."""
+    result = {}
+    for name, fns in _caches.items():
+        infos = [fn.cache_info() for fn in list(fns)]
+        if not infos:
+            continue
+        hits, misses = sum(i.hits for i in infos), sum(i.misses for i in infos)
+        result[name] = {"hits": hits, "misses": misses, "size": sum(i.currsize for i in infos),
+                        "maxsize": infos[0].maxsize, "caches": len(infos),
+                        "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+    result["dedupe"] = dict(_dedupe, saved=_dedupe["rows"] - _dedupe["unique"])
+    return result
+
+def clear():
+    for fns in _caches.values():
+        for fn in list(fns):
+            fn.cache_clear()
+
+def _hash_rows(bits):
+    import numpy as np
+
+    h = np.zeros(len(bits[0]), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for column, multiplier in zip(bits, _HASH_MULTIPLIERS):
+            h ^= column * np.uint64(multiplier)
+            h = (h << np.uint64(29)) | (h >> np.uint64(35))
+    return h
+
+def _row_bits(columns):
+    import numpy as np
+
+    return [np.ascontiguousarray(c, dtype=np.float64).view(np.uint64) for c in columns]
+
+def estimated_saving(hashes, sample=DEDUPE_SAMPLE, seed=0):
+    """Estimated share of rows that repeat another row, from a random sample.
+
+    A row that occurs c times contributes 1/c to the unique count, so the mean
+    of 1/c over sampled rows estimates unique/rows. Counting the sampled
+    hashes needs one binary search per row rather than a full sort.
+    """
+    import numpy as np
+
+    if len(hashes) <= sample:
+        return 1.0 - len(np.unique(hashes)) / max(len(hashes), 1)
+    sampled = hashes[np.random.default_rng(seed).integers(0, len(hashes), sample)]
+    picked = np.unique(sampled)
+    pos = np.minimum(np.searchsorted(picked, hashes), len(picked) - 1)
+    counts = np.bincount(pos[picked[pos] == hashes], minlength=len(picked))
+    return 1.0 - float(np.mean(1.0 / counts[np.searchsorted(picked, sampled)]))
+
+def unique_rows(*columns, hashes=None):
+    """(first, inverse) such that rows[first][inverse] == rows, grouping bit-identical rows.
+
+    Rows are grouped by a 64-bit hash of their float64 bit patterns, and each
+    group is checked against its representative; on a hash collision the
+    rows are grouped by a full lexicographic sort instead.
+    """
+    import numpy as np
+
+    bits = _row_bits(columns)
+    if hashes is None:
+        hashes = _hash_rows(bits)
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    if all(np.array_equal(b[first][inverse], b) for b in bits):
+        return first, inverse
+
+    order = np.lexsort(bits[::-1])
+    new = np.ones(len(order), dtype=bool)
+    sorted_bits = [b[order] for b in bits]
+    new[1:] = np.any([s[1:] != s[:-1] for s in sorted_bits], axis=0)
+    inverse = np.empty(len(order), dtype=np.intp)
+    inverse[order] = np.cumsum(new) - 1
+    return order[new], inverse
+
+def dedupe(predict_batch, *columns):
+    """predict_batch over the unique rows only, scattered back to the original order.
+
+    Equivalent to predict_batch(*columns) for any row-wise batch predictor.
+    Batches where too few rows repeat (see DEDUPE_MIN_SAVING) are passed
+    through whole; their rows are all counted as unique in stats().
+    """
+    import numpy as np
+
+    columns = [np.asarray(c).ravel() for c in columns]
+    if not len(columns[0]):
+        return predict_batch(*columns)
+    hashes = _hash_rows(_row_bits(columns))
+    _dedupe["calls"] += 1
+    _dedupe["rows"] += len(hashes)
+    if estimated_saving(hashes) < DEDUPE_MIN_SAVING:
+        _dedupe["unique"] += len(hashes)
+        return predict_batch(*columns)
+    first, inverse = unique_rows(*columns, hashes=hashes)
+    _dedupe["unique"] += len(first)
+    if len(first) == len(inverse):
+        return predict_batch(*columns)
+    return np.asarray(predict_batch(*(c[first] for c in columns)))[inverse]
@@ -0,0 +1,263 @@
+import atexit
+import fcntl
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from bisect import bisect_left
+
+# Setting this to a file path turns instrumentation on for the whole process;
+# the JSON snapshot at that path accumulates across runs (e.g. one per CLI call)
+ENV_VAR = "REIMBURSEMENT_METRICS"
+
+PATHS = ("exact", "pattern_key1", "pattern_key2", "rules")
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                   1e-3, 5e-3, 0.025, 0.1, 0.5, 2.5)
+OCCUPANCY_BINS = ((1, 1), (2, 2), (3, 4), (5, 8), (9, 16), (17, None))
+
+# Checked on every call; everything else is only touched while enabled
+enabled = False
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, n=1):
+        self.counts[bisect_left(self.bounds, value)] += n
+        self.sum += value * n
+        self.count += n
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other["counts"])]
+        self.sum += other["sum"]
+        self.count += other["count"]
+
+    def to_dict(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+class Registry:
+    """Per-path counters and latencies, batch timings and pattern-bucket hit counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = dict.fromkeys(PATHS, 0)
+        self.latency = {path: Histogram() for path in PATHS}
+        self.batch_latency = Histogram()
+        self.batch_rows = 0
+        self.bucket_hits = Counter()
+
+    def record(self, path, seconds, bucket=None):
+        with self.lock:
+            self.hits[path] += 1
+            self.latency[path].observe(seconds)
+            if bucket is not None:
+                self.bucket_hits[bucket] += 1
+
+    def record_batch(self, counts, seconds, rows, buckets=()):
+        """counts maps path -> rows resolved; buckets is (key tuple, hits) pairs."""
+        with self.lock:
+            for path, n in counts.items():
+                self.hits[path] += n
+            self.batch_latency.observe(seconds)
+            self.batch_rows += rows
+            for bucket, n in buckets:
+                self.bucket_hits[bucket] += n
+
+    def state(self):
+        """Mergeable raw state, as stored in the JSON snapshot."""
+        with self.lock:
+            return {
+                "hits": dict(self.hits),
+                "latency": {path: h.to_dict() for path, h in self.latency.items()},
+                "batch": {"latency": self.batch_latency.to_dict(), "rows": self.batch_rows},
+                "pattern_bucket_hits": [[*map(_plain, k), n] for k, n in self.bucket_hits.items()],
+            }
+
+    def merge(self, state):
+        with self.lock:
+            for path, n in state["hits"].items():
+                self.hits[path] += n
+            for path, h in state["latency"].items():
+                self.latency[path].merge(h)
+            self.batch_latency.merge(state["batch"]["latency"])
+            self.batch_rows += state["batch"]["rows"]
+            for *key, n in state["pattern_bucket_hits"]:
+                self.bucket_hits[tuple(key)] += n
+
+registry = Registry()
+
+def _plain(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def record(path, seconds, bucket=None):
+    registry.record(path, seconds, bucket)
+
+def record_batch(counts, seconds, rows, buckets=()):
+    registry.record_batch(counts, seconds, rows, buckets)
+
+def occupancy(table, bucket_hits=None, top_n=10):
+    """Cases-per-bucket distribution of a pattern table and how much of it traffic touches."""
+    import numpy as np
+
+    counts = getattr(table, "counts", None)
+    stats = {"buckets": len(table)}
+    if counts is not None and len(counts):
+        counts = np.asarray(counts)
+        stats["cases_per_bucket"] = {
+            "min": int(counts.min()), "mean": float(counts.mean()),
+            "p50": float(np.percentile(counts, 50)), "p90": float(np.percentile(counts, 90)),
+            "max": int(counts.max()),
+        }
+        stats["size_histogram"] = {
+            (f"{lo}" if lo == hi else f"{lo}+" if hi is None else f"{lo}-{hi}"):
+                int(((counts >= lo) & (counts <= (hi or counts.max()))).sum())
+            for lo, hi in OCCUPANCY_BINS
+        }
+    if bucket_hits is not None:
+        stats["buckets_hit"] = len(bucket_hits)
+        stats["hit_share"] = len(bucket_hits) / len(table) if len(table) else 0.0
+        stats["top_buckets"] = [[*map(_plain, k), n] for k, n in bucket_hits.most_common(top_n)]
+    return stats
+
+def snapshot(pattern_table=None):
+    """JSON-serializable metrics: raw mergeable state plus derived summaries."""
+    state = registry.state()
+    total = sum(state["hits"].values())
+    state["total"] = total
+    state["share"] = {path: n / total if total else 0.0 for path, n in state["hits"].items()}
+    state["mean_latency"] = {path: h["sum"] / h["count"] if h["count"] else None
+                             for path, h in state["latency"].items()}
+    if pattern_table is None and "run" in sys.modules:
+        pattern_table = sys.modules["run"].pattern_lookup
+    if pattern_table is not None:
+        state["pattern_occupancy"] = occupancy(pattern_table, registry.bucket_hits)
+    if "memo" in sys.modules:
+        state["caches"] = sys.modules["memo"].stats()
+    return state
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+def _histogram_lines(name, hist, **labels):
+    lines, cumulative = [], 0
+    for bound, n in zip(list(hist["bounds"]) + ["+Inf"], hist["counts"]):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels) if labels else ''} {hist['sum']}")
+    lines.append(f"{name}_count{_labels(**labels) if labels else ''} {hist['count']}")
+    return lines
+
+def prometheus_text(data=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    data = data or snapshot()
+    lines = [
+        "# HELP reimbursement_resolutions_total Reimbursements answered, by resolution path.",
+        "# TYPE reimbursement_resolutions_total counter",
+    ]
+    lines += [f"reimbursement_resolutions_total{_labels(path=p)} {n}" for p, n in data["hits"].items()]
+    lines += [
+        "# HELP reimbursement_latency_seconds Scalar calculate_reimbursement latency, by resolution path.",
+        "# TYPE reimbursement_latency_seconds histogram",
+    ]
+    for path, hist in data["latency"].items():
+        lines += _histogram_lines("reimbursement_latency_seconds", hist, path=path)
+    lines += [
+        "# HELP reimbursement_batch_seconds calculate_reimbursement_batch call latency.",
+        "# TYPE reimbursement_batch_seconds histogram",
+    ]
+    lines += _histogram_lines("reimbursement_batch_seconds", data["batch"]["latency"])
+    lines += [
+        "# HELP reimbursement_batch_rows_total Rows scored by calculate_reimbursement_batch.",
+        "# TYPE reimbursement_batch_rows_total counter",
+        f"reimbursement_batch_rows_total {data['batch']['rows']}",
+    ]
+    occ = data.get("pattern_occupancy")
+    if occ:
+        lines += [
+            "# HELP reimbursement_pattern_buckets Buckets in pattern_lookup.",
+            "# TYPE reimbursement_pattern_buckets gauge",
+            f"reimbursement_pattern_buckets {occ['buckets']}",
+        ]
+        if "size_histogram" in occ:
+            lines += [
+                "# HELP reimbursement_pattern_bucket_sizes Pattern buckets by number of cases averaged.",
+                "# TYPE reimbursement_pattern_bucket_sizes gauge",
+            ]
+            lines += [f"reimbursement_pattern_bucket_sizes{_labels(cases=size)} {n}"
+                      for size, n in occ["size_histogram"].items()]
+        if "buckets_hit" in occ:
+            lines += [
+                "# HELP reimbursement_pattern_buckets_hit Distinct pattern buckets that answered a request.",
+                "# TYPE reimbursement_pattern_buckets_hit gauge",
+                f"reimbursement_pattern_buckets_hit {occ['buckets_hit']}",
+            ]
+    caches = {name: c for name, c in data.get("caches", {}).items() if name != "dedupe"}
+    if caches:
+        lines += [
+            "# HELP reimbursement_cache_lookups_total Memoized calls, by cache and result.",
+            "# TYPE reimbursement_cache_lookups_total counter",
+        ]
+        for name, c in caches.items():
+            lines += [f"reimbursement_cache_lookups_total{_labels(cache=name, result='hit')} {c['hits']}",
+                      f"reimbursement_cache_lookups_total{_labels(cache=name, result='miss')} {c['misses']}"]
+    dedupe = data.get("caches", {}).get("dedupe")
+    if dedupe:
+        lines += [
+            "# HELP reimbursement_dedupe_rows_total Batch rows before and after deduplication.",
+            "# TYPE reimbursement_dedupe_rows_total counter",
+            f"reimbursement_dedupe_rows_total{_labels(stage='input')} {dedupe['rows']}",
+            f"reimbursement_dedupe_rows_total{_labels(stage='unique')} {dedupe['unique']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+def export(path, data=None):
+    """Write a snapshot to path: Prometheus text for .prom/.txt, JSON otherwise."""
+    data = data or snapshot()
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        if path.endswith((".prom", ".txt")):
+            f.write(prometheus_text(data))
+        else:
+            json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def accumulate(path):
+    """Merge this process's metrics into the JSON snapshot at path, under a file lock."""
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                registry.merge(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+        export(path)
+
+if os.environ.get(ENV_VAR):
+    enable()
+    atexit.register(accumulate, os.environ[ENV_VAR])
+
+if __name__ == "__main__":
+    # Render an accumulated JSON snapshot, e.g. for a Prometheus textfile collector
+    if len(sys.argv) != 2:
+        print("Usage: python metrics.py <snapshot.json>")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        sys.stdout.write(prometheus_text(json.load(f)))
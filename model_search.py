@@ -0,0 +1,217 @@
+import argparse
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from benchmark import time_per_call, time_run
+from cases import load_cases
+from crossval import holdout_split
+from forest import CompiledForest, compile_pipeline
+from lookup_tables import round2
+from private_run import MODEL_PARAMS, PARAMS_PATH, build_model, load_model_params
+
+# Candidate configurations: every combination is tried
+DEFAULT_GRID = {
+    "degree": [1, 2, 3],
+    "n_estimators": [25, 50, 100, 200],
+    "max_depth": [4, 6, 8, 10, 14],
+    "min_samples_leaf": [1, 2, 4],
+}
+# Each rung keeps 1/ETA of the candidates and gives them ETA times the data and trees
+ETA = 3
+BATCH_ROWS = 10_000
+
+_data = None
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+def prepare_data(cases, holdout=0.2, seed=0, degrees=(1, 2, 3)):
+    """Shared preprocessing: the validation split, and polynomial features once per degree."""
+    X = np.column_stack(cases.columns()).astype(np.float64)
+    (train, valid), = holdout_split(len(cases), holdout, seed)
+    # Rungs train on growing prefixes of a shuffled training set, so each rung's rows include the last's
+    train = np.random.default_rng(seed).permutation(train)
+    features = {degree: build_model(dict(MODEL_PARAMS, degree=degree)).steps[0][1].fit_transform(X)
+                for degree in degrees}
+    return {"X": X, "y": cases.expected, "train": train, "valid": valid, "features": features}
+
+def evaluate(params, fraction=1.0, compiled=False, data=None):
+    """Validation error of params trained on a fraction of the training rows with that fraction of its trees.
+
+    cost estimates full-budget inference work (trees x mean depth); with
+    compiled the fitted pipeline's CompiledForest arrays are returned too.
+    """
+    data = data or _data
+    train = data["train"][:max(2, math.ceil(len(data["train"]) * fraction))]
+    trees = max(1, math.ceil(params["n_estimators"] * fraction))
+    pipeline = build_model(dict(params, n_estimators=trees))
+    poly, forest = pipeline.steps[0][1], pipeline.steps[-1][1]
+    poly.fit(data["X"][:1])
+    # The cached features are exactly what the pipeline's PolynomialFeatures would produce
+    features = data["features"][params["degree"]]
+    forest.fit(features[train], data["y"][train])
+    valid = data["valid"]
+    error = np.abs(round2(forest.predict(features[valid])) - data["y"][valid])
+    result = {
+        "error": float(error.mean()),
+        "cost": params["n_estimators"] * float(np.mean([e.tree_.max_depth for e in forest.estimators_])),
+    }
+    if compiled:
+        result["arrays"] = compile_pipeline(pipeline)
+    return result
+
+def pareto_front(points):
+    """Indices of the points no other point dominates, every objective minimized."""
+    points = np.asarray(points, dtype=np.float64)
+    return [i for i, p in enumerate(points)
+            if not np.any(np.all(points <= p, axis=1) & np.any(points < p, axis=1))]
+
+def pareto_ranks(points):
+    """Non-dominated sorting: 0 for the Pareto front, 1 for the front once that is removed, ..."""
+    points = np.asarray(points, dtype=np.float64)
+    ranks = np.full(len(points), -1)
+    remaining = np.arange(len(points))
+    rank = 0
+    while len(remaining):
+        front = remaining[pareto_front(points[remaining])]
+        ranks[front] = rank
+        remaining = np.setdiff1d(remaining, front)
+        rank += 1
+    return ranks
+
+def measure_latency(arrays, X, repeats=5):
+    """(seconds per single-row predict, seconds per row in a BATCH_ROWS batch) of a compiled forest."""
+    forest = CompiledForest(arrays)
+    rows = [([row],) for row in X[:200].tolist()]
+    batch = np.tile(X, (-(-BATCH_ROWS // len(X)), 1))[:BATCH_ROWS]
+    return time_per_call(forest.predict, rows, repeats), time_run(lambda: forest.predict(batch), repeats) / len(batch)
+
+class Evaluator:
+    """Evaluates candidate lists at a budget fraction across worker processes."""
+
+    def __init__(self, data, jobs=1):
+        self.data = data
+        self.pool = None
+        if jobs > 1:
+            self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(data,))
+
+    def __call__(self, candidates, fraction, compiled=False):
+        if self.pool is None:
+            return [evaluate(c, fraction, compiled, self.data) for c in candidates]
+        return list(self.pool.map(evaluate, candidates, repeat(fraction), repeat(compiled)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+def successive_halving(evaluate_many, candidates, rungs=3, eta=ETA, keep=()):
+    """Evaluate candidates on growing budgets, promoting the best 1/eta after each rung.
+
+    Promotion ranks by Pareto front over (error, cost) and then error, so cheap
+    models that are nearly as accurate survive next to the most accurate ones.
+    Candidates at indices in keep are always promoted. Returns the final rung's
+    candidates with their results (including compiled forest arrays).
+    """
+    survivors = list(range(len(candidates)))
+    for rung in range(rungs):
+        fraction = eta ** (rung - rungs + 1)
+        last = rung == rungs - 1
+        results = evaluate_many([candidates[i] for i in survivors], fraction, compiled=last)
+        best = min(r["error"] for r in results)
+        print(f"🪜 Rung {rung + 1}: {len(survivors)} candidates at {fraction:.3g} of the rows and trees, "
+              f"best validation error ${best:.2f}")
+        if last:
+            return [(candidates[i], r) for i, r in zip(survivors, results)]
+        ranks = pareto_ranks([(r["error"], r["cost"]) for r in results])
+        order = sorted(range(len(survivors)), key=lambda j: (ranks[j], results[j]["error"]))
+        promoted = {survivors[j] for j in order[:max(1, math.ceil(len(survivors) / eta))]}
+        promoted |= {i for i in survivors if i in keep}
+        survivors = [i for i in survivors if i in promoted]
+
+def choose(final, target):
+    """The lowest single-row latency configuration with error <= target (or the most accurate)."""
+    meeting = [entry for entry in final if entry["error"] <= target]
+    if not meeting:
+        return min(final, key=lambda entry: entry["error"])
+    return min(meeting, key=lambda entry: (entry["row_latency"], entry["batch_latency"], entry["error"]))
+
+def candidate_grid(grid, baseline):
+    names = list(grid)
+    candidates = [dict(baseline, **dict(zip(names, values))) for values in itertools.product(*grid.values())]
+    if baseline not in candidates:
+        candidates.append(dict(baseline))
+    return candidates
+
+def _describe(params):
+    return (f"degree={params['degree']} trees={params['n_estimators']} "
+            f"depth={params['max_depth']} leaf={params['min_samples_leaf']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Search private_run.py model configurations for the cheapest one that meets an accuracy target.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--rungs", type=int, default=3, help="successive-halving rungs")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of the cases used for validation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target-error", type=float, metavar="DOLLARS",
+                        help="accuracy target (mean absolute validation error); default: the current config's "
+                             "error plus --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="relative error increase accepted over the current config (default: 1%%)")
+    parser.add_argument("--grid", metavar="JSON", help='candidate values, e.g. \'{"n_estimators": [50, 100]}\'')
+    parser.add_argument("--repeats", type=int, default=5, help="latency timing repeats")
+    parser.add_argument("--save", metavar="PATH", nargs="?", const=PARAMS_PATH,
+                        help=f"write the chosen params as JSON (default path {PARAMS_PATH}, which private_run.py reads)")
+    args = parser.parse_args(argv)
+
+    grid = dict(DEFAULT_GRID, **json.loads(args.grid)) if args.grid else DEFAULT_GRID
+    baseline = load_model_params()
+    candidates = candidate_grid(grid, baseline)
+    data = prepare_data(load_cases("public_cases.json"), args.holdout, args.seed,
+                        sorted({c["degree"] for c in candidates}))
+    print(f"🔎 Searching {len(candidates)} configurations on {len(data['train'])} training "
+          f"and {len(data['valid'])} validation cases\n")
+
+    evaluate_many = Evaluator(data, args.jobs)
+    try:
+        survivors = successive_halving(evaluate_many, candidates, args.rungs, keep={candidates.index(baseline)})
+    finally:
+        evaluate_many.close()
+
+    # Latency is measured here, one model at a time, so workers don't compete for cores
+    final = []
+    for params, result in survivors:
+        row_latency, batch_latency = measure_latency(result["arrays"], data["X"][data["valid"]], args.repeats)
+        final.append({"params": params, "error": result["error"],
+                      "row_latency": row_latency, "batch_latency": batch_latency})
+    front = set(pareto_front([(e["error"], e["row_latency"], e["batch_latency"]) for e in final]))
+    base = next(e for e in final if e["params"] == baseline)
+    target = base["error"] * (1 + args.tolerance) if args.target_error is None else args.target_error
+    chosen = choose([final[i] for i in sorted(front)], target)
+
+    print("\n📈 Final rung (★ = Pareto front of error vs single-row and batch latency):")
+    for i in sorted(range(len(final)), key=lambda i: final[i]["error"]):
+        entry = final[i]
+        notes = (" ← chosen" if entry is chosen else "") + (" (current)" if entry is base else "")
+        print(f"  {'★' if i in front else ' '} ${entry['error']:7.2f}  {entry['row_latency'] * 1e6:8.1f} µs/row  "
+              f"{entry['batch_latency'] * 1e6:7.2f} µs/row batched  {_describe(entry['params'])}{notes}")
+
+    print(f"\n🏆 Cheapest configuration within ${target:.2f} validation error:")
+    print(f"  {_describe(chosen['params'])}")
+    print(f"  Error ${chosen['error']:.2f} (current ${base['error']:.2f}); single-row "
+          f"{chosen['row_latency'] * 1e6:.1f} µs (current {base['row_latency'] * 1e6:.1f} µs)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(chosen["params"], f, indent=2)
+        print(f"✅ Saved to {args.save}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from cases import load_training_cases
+from snapshot import data_fingerprint
+
+DEFAULT_K = 10
+
+class NeighborIndex:
+    """k-nearest-neighbour index over min-max normalized (days, miles, receipts).
+
+    Predictions are the inverse-distance weighted mean of the k nearest
+    historical outputs; a query that coincides with a case returns its output.
+    """
+
+    def __init__(self, days, miles, receipts, outputs):
+        from scipy.spatial import cKDTree
+
+        points = np.column_stack([days, miles, receipts]).astype(np.float64)
+        self.outputs = np.asarray(outputs, dtype=np.float64)
+        self.offset = points.min(axis=0) if len(points) else np.zeros(3)
+        span = points.max(axis=0) - self.offset if len(points) else np.ones(3)
+        self.scale = np.where(span > 0, span, 1.0)
+        self.tree = cKDTree((points - self.offset) / self.scale)
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def query(self, days, miles, receipts, k=DEFAULT_K):
+        """Weighted k-NN predictions for columns of inputs (unrounded)."""
+        points = np.column_stack([np.asarray(days, dtype=np.float64).ravel(),
+                                  np.asarray(miles, dtype=np.float64).ravel(),
+                                  np.asarray(receipts, dtype=np.float64).ravel()])
+        k = min(k, len(self.outputs))
+        if k == 0 or not len(points):
+            return np.full(len(points), np.nan)
+        dist, idx = self.tree.query((points - self.offset) / self.scale, k=k)
+        dist, idx = dist.reshape(len(points), k), idx.reshape(len(points), k)
+        weights = 1 / np.maximum(dist, 1e-12)
+        return (weights * self.outputs[idx]).sum(axis=1) / weights.sum(axis=1)
+
+    def predict(self, trip_days, miles, receipts, k=DEFAULT_K):
+        return float(self.query([trip_days], [miles], [receipts], k)[0])
+
+_indexes = {}
+
+def load_neighbor_index(path="public_cases.json"):
+    """The index over a case file and the cases ingested into it since, built once per version of that data.
+
+    Cached by the same content hashes the lookup snapshot is checked against,
+    so an ingest (or any edit to the files) builds a new index.
+    """
+    key = (path, data_fingerprint(path))
+    if key not in _indexes:
+        cases = load_training_cases(path)
+        # Only the current version of each file is kept
+        for stale in [k for k in _indexes if k[0] == path]:
+            del _indexes[stale]
+        _indexes[key] = NeighborIndex(cases.days, cases.miles, cases.receipts, cases.expected)
+    return _indexes[key]
@@ -0,0 +1,241 @@
+import os
+from bisect import bisect_left
+
+import profiling
+from snapshot import cache_path, ingested_path, is_current, read_snapshot
+
+# Packed int64 keys: days | miles | cents
+DAYS_BITS = 12
+MILES_BITS = 24
+CENTS_BITS = 27
+
+_DAYS_END, _MILES_END, _CENTS_END = 1 << DAYS_BITS, 1 << MILES_BITS, 1 << CENTS_BITS
+_DAYS_SHIFT = MILES_BITS + CENTS_BITS
+_MISSING = object()
+
+# Reading tables doesn't need numpy; lookup_tables.py builds them. run.py's one-shot
+# CLI only imports this module, so it starts without loading numpy at all.
+
+def pack_key(key):
+    """The packed int64 of a (days, miles, amount) key, as pack_keys packs it, or None if it can't be packed."""
+    try:
+        days, miles, amount = key
+        cents = round(amount * 100)
+        # run.py's keys hold ints except for the amount; anything else must be integral to pack
+        if type(days) is not int:
+            if days != int(days):
+                return None
+            days = int(days)
+        if type(miles) is not int:
+            if miles != int(miles):
+                return None
+            miles = int(miles)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if 0 <= days < _DAYS_END and 0 <= miles < _MILES_END and 0 <= cents < _CENTS_END and cents / 100 == amount:
+        return (days << _DAYS_SHIFT) | (miles << CENTS_BITS) | cents
+    return None
+
+class PackedTable:
+    """Read-only (days, miles, amount) -> float mapping over sorted packed keys.
+
+    Supports the dict operations run.py uses (`in`, `[]`, `get`) plus a
+    vectorized `probe`. Keys that can't be packed live in a small overflow dict.
+    counts, when given, holds the number of cases averaged into each value.
+    Scalar lookups bisect the (memory-mapped) keys in place, so opening a
+    table costs the same whatever its size and forked servers share it.
+    deltas are newer tables (oldest first, e.g. ingested delta segments)
+    whose keys take precedence over this one's.
+    """
+
+    def __init__(self, keys, values, integral=None, overflow=None, counts=None, deltas=()):
+        self.keys = keys
+        self.values = values
+        self.integral = integral
+        self.overflow = overflow or {}
+        self.deltas = list(deltas)
+        self._counts = counts
+        self._keys, self._values = memoryview(keys), memoryview(values)
+        self._integral = memoryview(integral) if integral is not None else None
+        # Newest first, so the first match wins
+        self._newer = self.deltas[::-1]
+
+    def __len__(self):
+        if not self.deltas:
+            return len(self.keys) + len(self.overflow)
+        import numpy as np
+        keys = np.concatenate([np.asarray(t.keys) for t in [self, *self.deltas]])
+        return len(np.unique(keys)) + len(self.overflow)
+
+    @property
+    def counts(self):
+        """Cases averaged into each value: one per distinct packed key, then one per overflow key."""
+        if not self.deltas or self._counts is None:
+            return self._counts
+        import numpy as np
+        counts = np.asarray(self._counts)
+        layers = [{"keys": self.keys, "counts": counts[:len(self.keys)]}]
+        layers += [{"keys": t.keys, "counts": t._counts} for t in self.deltas]
+        return np.r_[merge_layers(layers)["counts"], counts[len(self.keys):]]
+
+    def get(self, key, default=None):
+        packed = pack_key(key)
+        if packed is not None:
+            if self._newer:
+                for table in self._newer:
+                    value = table._find(packed)
+                    if value is not _MISSING:
+                        return value
+            # _find inlined: this is run.py's per-call hot path
+            keys = self._keys
+            i = bisect_left(keys, packed)
+            if i < len(keys) and keys[i] == packed:
+                value = self._values[i]
+                # Outputs that were integer literals come back as ints, as the original dicts held them
+                return int(value) if self._integral is not None and self._integral[i] else value
+        return self.overflow.get(key, default) if self.overflow else default
+
+    def _find(self, packed):
+        keys = self._keys
+        i = bisect_left(keys, packed)
+        if i < len(keys) and keys[i] == packed:
+            value = self._values[i]
+            return int(value) if self._integral is not None and self._integral[i] else value
+        return _MISSING
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def probe(self, keys, valid):
+        """Vectorized lookup of packed keys; returns (found mask, values)."""
+        import numpy as np
+
+        found = np.zeros(len(keys), dtype=bool)
+        values = np.full(len(keys), np.nan)
+        # Oldest layer first, so newer layers overwrite the keys they share
+        for table in [self, *self.deltas]:
+            table_keys, table_values = np.asarray(table.keys), np.asarray(table.values)
+            if len(table_keys):
+                idx = np.minimum(np.searchsorted(table_keys, keys), len(table_keys) - 1)
+                hit = valid & (table_keys[idx] == keys)
+                values[hit] = table_values[idx[hit]]
+                found |= hit
+        return found, values
+
+def merge_layers(layers, key="keys"):
+    """One sorted layer from sorted layers of like-named columns (oldest first), keeping each key's newest row."""
+    import numpy as np
+
+    keys = np.concatenate([np.asarray(layer[key]) for layer in layers])
+    # A stable sort keeps equal keys in layer order, so the last of each run is the newest
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    rows = order[np.r_[sorted_keys[1:] != sorted_keys[:-1], True]] if len(keys) else order
+    return {name: np.concatenate([np.asarray(layer[name]) for layer in layers])[rows] for name in layers[0]}
+
+def snapshot_path(source):
+    return cache_path(source, ".lookup")
+
+def delta_path(path, seq):
+    return f"{path}.delta.{seq}"
+
+def delta_seqs(path):
+    """Sequence numbers of the delta segment files next to a snapshot, newest first."""
+    directory, prefix = os.path.split(path)
+    prefix += ".delta."
+    try:
+        names = os.listdir(directory or ".")
+    except OSError:
+        return []
+    return sorted((int(name[len(prefix):]) for name in names
+                   if name.startswith(prefix) and name[len(prefix):].isdigit()), reverse=True)
+
+def read_deltas(path, header, raw=False):
+    """(header, arrays) of the delta segments layered on a snapshot, oldest first.
+
+    Each segment names the one it was layered on as its base (0 for the
+    snapshot itself), so following bases down from the newest segment of the
+    snapshot's generation skips segments that a compaction or rebuild replaced.
+    """
+    generation = header.get("generation")
+    if generation is None:
+        return []
+    for seq in delta_seqs(path):
+        delta = read_snapshot(delta_path(path, seq), raw)
+        if delta[0].get("generation") == generation:
+            break
+    else:
+        return []
+    deltas = [delta]
+    while delta[0]["base"]:
+        delta = read_snapshot(delta_path(path, delta[0]["base"]), raw)
+        if delta[0].get("generation") != generation:
+            raise ValueError(f"{path} is missing delta segment {deltas[-1][0]['base']}")
+        deltas.append(delta)
+    return deltas[::-1]
+
+def tables_from_snapshot(header, arrays, deltas=()):
+    # The newest segment carries the whole overflow
+    overflow = (deltas[-1][0] if deltas else header).get("overflow", {})
+    exact_overflow = {tuple(k): v for k, v in overflow.get("exact", [])}
+    pattern_overflow = {tuple(k): total / count for k, (total, count) in overflow.get("pattern", [])}
+    exact = PackedTable(arrays["exact_keys"], arrays["exact_values"], arrays["exact_integral"], exact_overflow,
+                        deltas=[PackedTable(a["exact_keys"], a["exact_values"], a["exact_integral"])
+                                for _, a in deltas])
+    counts = arrays["pattern_counts"]
+    if pattern_overflow:
+        import numpy as np
+        counts = np.r_[counts, [count for _, (_, count) in overflow["pattern"]]]
+    pattern = PackedTable(arrays["pattern_keys"], arrays["pattern_values"], overflow=pattern_overflow, counts=counts,
+                          deltas=[PackedTable(a["pattern_keys"], a["pattern_values"], counts=a["pattern_counts"])
+                                  for _, a in deltas])
+    return exact, pattern
+
+def read_current_snapshot(source, path=None, raw=False):
+    """(header, arrays, deltas) of the lookup snapshot if it matches source and its ingest log, else None."""
+    path = path or snapshot_path(source)
+    try:
+        header, arrays = read_snapshot(path, raw)
+        deltas = read_deltas(path, header, raw)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not is_current(header, source):
+        return None
+    # The newest segment describes the log as of the last append
+    ingested = (deltas[-1][0] if deltas else header).get("ingested")
+    log = ingested_path(source)
+    if not os.path.exists(log):
+        return None if ingested else (header, arrays, deltas)
+    if not is_current({"source": ingested or {}}, log):
+        return None
+    return header, arrays, deltas
+
+def load_lookup_tables(source="public_cases.json"):
+    """Return (exact_lookup, pattern_lookup) backed by a memory-mapped snapshot
+    and the delta segments ingest.py layered on it.
+
+    The snapshot is rebuilt whenever the content hash of the source changes,
+    or its ingest log changes other than through ingest.py. Its arrays are
+    memoryviews; np.asarray views them as arrays without copying.
+    """
+    path = snapshot_path(source)
+    # Opening is a stat and an mmap unless the source changed and has to be re-hashed
+    with profiling.phase("open lookup snapshot"):
+        current = read_current_snapshot(source, path, raw=True)
+    if current is None:
+        from lookup_tables import build_source_tables, compile_snapshot
+        try:
+            with profiling.phase("compile lookup snapshot"):
+                compile_snapshot(source, path)
+            current = (*read_snapshot(path, raw=True), [])
+        except OSError:
+            # .cache/ isn't writable (read-only checkout, or a file in its place): build in memory
+            with profiling.phase("build lookup tables in memory"):
+                return build_source_tables(source)
+    return tables_from_snapshot(*current)
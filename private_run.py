@@ -1,50 +1,228 @@
 import sys
 import json
+import hashlib
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import make_pipeline
+
+import memo
+import profiling
+from cases import ingested_path, load_training_cases, plain_number
+from forest import CompiledForest
+from lookup_tables import round2
+from snapshot import file_sha256
+
+MODEL_PARAMS = {
+    "degree": 2,
+    "n_estimators": 200,
+    "max_depth": 10,
+    "random_state": 42,
+    "min_samples_leaf": 2,
+}
+MODEL_DIR = ".cache"
+# model_search.py --save writes the chosen configuration here; it overrides MODEL_PARAMS
+PARAMS_PATH = "model_params.json"
+# Trees added per ingested batch by ReimbursementPredictor.grow
+EXTRA_TREES = 10
+
+def load_model_params(path=PARAMS_PATH):
+    """MODEL_PARAMS updated with an exported configuration, if there is one."""
+    try:
+        with open(path) as f:
+            return dict(MODEL_PARAMS, **json.load(f))
+    except FileNotFoundError:
+        return dict(MODEL_PARAMS)
+
+def build_model(params):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import PolynomialFeatures
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(
+        PolynomialFeatures(degree=params["degree"], include_bias=False),
+        RandomForestRegressor(n_estimators=params["n_estimators"],
+                              max_depth=params["max_depth"],
+                              random_state=params["random_state"],
+                              min_samples_leaf=params["min_samples_leaf"])
+    )
+
+def _exact_matches(cases):
+    outputs = [int(e) if is_int else e
+               for e, is_int in zip(cases.expected.tolist(), cases.expected_is_int.tolist())]
+    keys = zip(cases.days.tolist(), map(plain_number, cases.miles.tolist()), cases.receipts.tolist())
+    return dict(zip(keys, outputs))
 
 class ReimbursementPredictor:
-    def __init__(self):
-        self.public_cases = []
+    """Exact public matches plus the trained pipeline.
+
+    With compiled=True (the default) the pipeline is served from its
+    flattened CompiledForest, so a process that finds a compiled artifact
+    never imports scikit-learn; compiled=False serves the sklearn pipeline.
+    """
+
+    def __init__(self, cases_path="public_cases.json", params=None, compiled=True):
+        self.cases_path = cases_path
+        self.params = dict(params or load_model_params())
+        self.compiled = compiled
+        self.public_cases = None
         self.exact_matches = {}
         self.model = None
-        
+        self.fingerprint = None
+        self.data_fingerprint = None
+        self._predict_cached = memo.lru("ReimbursementPredictor.predict")(self._predict)
+
+    def _read_cases(self):
+        self.public_cases = load_training_cases(self.cases_path)
+        # Answers memoized for the previous data or model are stale
+        self._predict_cached.cache_clear()
+
+        # Artifacts are versioned by the training data (the case file and any cases
+        # ingested since) and hyperparameters; pickled pipelines also by the sklearn
+        # version (see _sklearn_fingerprint)
+        digest = hashlib.sha256(file_sha256(self.cases_path).encode())
+        log = ingested_path(self.cases_path)
+        if os.path.exists(log):
+            digest.update(file_sha256(log).encode())
+        digest.update(json.dumps(self.params, sort_keys=True).encode())
+        self.data_fingerprint = digest.hexdigest()
+        self.fingerprint = None
+
+        self.exact_matches = _exact_matches(self.public_cases)
+
+    def _sklearn_fingerprint(self):
+        if self.fingerprint is None:
+            import sklearn
+            digest = hashlib.sha256(self.data_fingerprint.encode())
+            digest.update(sklearn.__version__.encode())
+            self.fingerprint = digest.hexdigest()
+        return self.fingerprint
+
+    def artifact_path(self):
+        return os.path.join(MODEL_DIR, f"reimbursement_model-{self._sklearn_fingerprint()[:16]}.pkl")
+
+    def forest_path(self):
+        return os.path.join(MODEL_DIR, f"reimbursement_forest-{self.data_fingerprint[:16]}.forest")
+
+    def _training_data(self):
+        cases = self.public_cases
+        X = np.column_stack([cases.days, cases.miles, cases.receipts]).astype(np.float64)
+        return X, cases.expected
+
+    def train(self):
+        """Fit the model on the public (and ingested) cases and save it as a reusable artifact."""
+        self._read_cases()
+        pipeline = build_model(self.params)
+        with profiling.phase("train model", rows=len(self.public_cases)):
+            pipeline.fit(*self._training_data())
+        return self._save(pipeline)
+
+    def grow(self, pipeline, extra_trees=EXTRA_TREES):
+        """Update a pipeline fitted before cases were ingested, instead of retraining it.
+
+        Exact matches are re-read, and extra_trees new trees are fitted on all
+        cases with warm_start while the existing trees are kept as they are.
+        The grown pipeline is saved as the artifact for the new data.
+        """
+        self._read_cases()
+        if extra_trees:
+            forest = pipeline.steps[-1][1]
+            forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + extra_trees)
+            pipeline.fit(*self._training_data())
+            forest.set_params(warm_start=False)
+        return self._save(pipeline)
+
+    def fit(self, cases, pipeline=None):
+        """Serve from an in-memory CaseSet (e.g. a cross-validation split) without any artifacts.
+
+        pipeline, if given, is already fitted on cases; otherwise one is fitted here.
+        """
+        self.public_cases = cases
+        self.exact_matches = _exact_matches(cases)
+        self._predict_cached.cache_clear()
+        self.fingerprint = self.data_fingerprint = None
+        if pipeline is None:
+            pipeline = build_model(self.params)
+            pipeline.fit(*self._training_data())
+        self.model = CompiledForest.from_pipeline(pipeline) if self.compiled else pipeline
+        return self
+
+    def _save(self, pipeline):
+        """Pickle pipeline as the artifact for the current data, compile it, and serve from it."""
+        path = self.artifact_path()
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump({"fingerprint": self._sklearn_fingerprint(), "model": pipeline}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.model = pipeline
+        self._compile()
+        return path
+
+    def _compile(self):
+        """Flatten the fitted pipeline into a CompiledForest artifact and serve from it if compiled."""
+        import sklearn
+        forest = CompiledForest.from_pipeline(self.model)
+        forest.save(self.forest_path(), {"fingerprint": self.data_fingerprint, "sklearn": sklearn.__version__})
+        if self.compiled:
+            self.model = forest
+
+    def _load_pipeline(self):
+        """The pickled pipeline for the current data, or None."""
+        try:
+            with open(self.artifact_path(), "rb") as f:
+                artifact = pickle.load(f)
+            if artifact["fingerprint"] != self._sklearn_fingerprint():
+                raise ValueError("stale model artifact")
+            return artifact["model"]
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+            return None
+
+    def load_pipeline(self):
+        """The fitted sklearn pipeline for the cases on disk, training it if no artifact matches."""
+        self._read_cases()
+        pipeline = self._load_pipeline()
+        if pipeline is None:
+            self.train()
+            pipeline = self._load_pipeline()
+        return pipeline
+
     def load_public_cases(self):
-        with open("public_cases.json") as f:
-            self.public_cases = json.load(f)
-        
-        # Create exact match dictionary
-        for case in self.public_cases:
-            key = (case["input"]["trip_duration_days"],
-                   case["input"]["miles_traveled"],
-                   case["input"]["total_receipts_amount"])
-            self.exact_matches[key] = case["expected_output"]
-        
-        # Prepare training data
-        X = []
-        y = []
-        
-        for case in self.public_cases:
-            X.append([
-                case["input"]["trip_duration_days"],
-                case["input"]["miles_traveled"],
-                case["input"]["total_receipts_amount"]
-            ])
-            y.append(case["expected_output"])
-        
-        # Create a more sophisticated model pipeline
-        self.model = make_pipeline(
-            PolynomialFeatures(degree=2, include_bias=False),
-            RandomForestRegressor(n_estimators=200, 
-                                max_depth=10,
-                                random_state=42,
-                                min_samples_leaf=2)
-        )
-        self.model.fit(X, y)
-    
+        """Load the exact matches and the trained model, training only if no artifact matches."""
+        with profiling.phase("load model"):
+            self._load_public_cases()
+
+    def _load_public_cases(self):
+        self._read_cases()
+        if self.compiled:
+            try:
+                header, forest = CompiledForest.load(self.forest_path())
+                if header.get("fingerprint") != self.data_fingerprint:
+                    raise ValueError("stale compiled forest")
+                self.model = forest
+                return
+            except (OSError, ValueError, KeyError):
+                pass
+
+        pipeline = self._load_pipeline()
+        if pipeline is None:
+            self.train()
+            return
+        self.model = pipeline
+        if self.compiled:
+            self._compile()
+
     def predict(self, trip_days, miles, receipts):
+        if self.model is None:
+            self.load_public_cases()
+        return self._predict_cached(trip_days, miles, receipts)
+
+    def _predict(self, trip_days, miles, receipts):
         # First try exact match
         exact_key = (trip_days, miles, receipts)
         if exact_key in self.exact_matches:
@@ -54,11 +232,108 @@ class ReimbursementPredictor:
         prediction = self.model.predict([[trip_days, miles, receipts]])
         return round(float(prediction[0]), 2)
 
-# Initialize and load data once
+    def predict_rows(self, rows):
+        """predict for a list of (trip_days, miles, receipts), with one model call for all non-exact rows.
+
+        Returns the same values predict would, row for row.
+        """
+        if self.model is None:
+            self.load_public_cases()
+
+        results = [self.exact_matches.get(tuple(row)) for row in rows]
+        # Repeated non-exact rows go through the model once and fan out to every position
+        missing = {}
+        for i, value in enumerate(results):
+            if value is None:
+                missing.setdefault(tuple(rows[i]), []).append(i)
+        if missing:
+            X = np.array(list(missing), dtype=np.float64)
+            for positions, value in zip(missing.values(), round2(self.model.predict(X)).tolist()):
+                for i in positions:
+                    results[i] = value
+        return results
+
+    def predict_many(self, trip_days, miles, receipts):
+        """Vectorized predict over columns of inputs, as a float64 array."""
+        days = np.asarray(trip_days, dtype=np.float64).ravel()
+        miles = np.asarray(miles, dtype=np.float64).ravel()
+        receipts = np.asarray(receipts, dtype=np.float64).ravel()
+        if not len(days) == len(miles) == len(receipts):
+            raise ValueError("trip_days, miles and receipts must have the same length")
+        rows = list(zip(days.tolist(), miles.tolist(), receipts.tolist()))
+        return np.array(self.predict_rows(rows), dtype=np.float64)
+
+class MicroBatcher:
+    """Collects concurrent predict calls and scores them as one batch.
+
+    The first waiting request opens a window of max_wait seconds (or until
+    max_batch requests are queued); everything queued by then goes through a
+    single predict_rows call. Callers block only for their own result.
+    """
+
+    def __init__(self, predictor, max_wait=0.002, max_batch=256):
+        self.predictor = predictor
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def predict(self, trip_days, miles, receipts):
+        if self.worker is None:
+            with self.lock:
+                if self.worker is None:
+                    self.worker = threading.Thread(target=self._run, daemon=True)
+                    self.worker.start()
+        future = Future()
+        self.requests.put(((trip_days, miles, receipts), future))
+        return future.result()
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.predictor.predict_rows([row for row, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+# The model is loaded lazily on the first predict
 predictor = ReimbursementPredictor()
-predictor.load_public_cases()
 
 if __name__ == "__main__":
+    # Long-lived worker: concurrent socket requests are micro-batched into one model call; stdin
+    # sends one request at a time, so it calls the predictor directly rather than wait out a window
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        from serve import serve_main
+        predictor.load_public_cases()
+        # Warm-up builds the forest's single-row structures before --workers forks; it must not go
+        # through the MicroBatcher, whose thread would not survive the fork
+        serve_main(predictor.predict, sys.argv[2:], prog="private_run.py --serve",
+                   warmup=lambda: predictor.model.predict([[1.0, 1.0, 1.0]]),
+                   socket_predict=MicroBatcher(predictor).predict)
+        sys.exit(0)
+
+    if len(sys.argv) == 2 and sys.argv[1] == "train":
+        print(f"✅ Model saved to {predictor.train()}")
+        sys.exit(0)
+
     if len(sys.argv) != 4:
         print("Usage: python perfect_run.py <trip_days> <miles> <receipts>")
         sys.exit(1)
@@ -72,4 +347,4 @@ if __name__ == "__main__":
         sys.exit(1)
 
     result = predictor.predict(days, miles, receipts)
-    print(result)
\ No newline at end of file
+    print(result)
@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+TRACES = ("none", "sample", "cprofile")
+# Seconds between stack samples of the profiled thread
+SAMPLE_INTERVAL = 0.005
+
+# Phases are recorded from import on, so work done while the entry point imports its
+# modules (e.g. run.py building its lookup tables) shows up under "startup". Starting the
+# interpreter and the imports before this one are CPU-bound, so the CPU time used so far
+# stands in for the wall time since the process started.
+_started = time.perf_counter() - time.process_time()
+
+class Phase:
+    """A running phase; set rows once the number of rows it handled is known."""
+
+    def __init__(self, rows=None):
+        self.rows = rows
+
+class Phases:
+    """Wall and CPU time of named phases, nested phases keyed by their parents' path.
+
+    Repeated phases with the same path accumulate, so recording is bounded by
+    the number of distinct phases rather than how often they run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = {}
+        self.totals = {}
+
+    @contextmanager
+    def phase(self, name, rows=None):
+        stack = self.stacks.setdefault(threading.get_ident(), [])
+        stack.append(name)
+        path = tuple(stack)
+        current = Phase(rows)
+        started, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield current
+        finally:
+            self.add(path, time.perf_counter() - started, time.process_time() - cpu, current.rows)
+            stack.pop()
+
+    def add(self, path, seconds, cpu_seconds=0.0, rows=None):
+        with self.lock:
+            total = self.totals.setdefault(tuple(path), {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rows": None})
+            total["calls"] += 1
+            total["seconds"] += seconds
+            total["cpu_seconds"] += cpu_seconds
+            if rows is not None:
+                total["rows"] = (total["rows"] or 0) + rows
+
+    def current(self, ident):
+        return list(self.stacks.get(ident, ()))
+
+    def reparent(self, parent):
+        """Move every phase recorded so far under parent."""
+        with self.lock:
+            self.totals = {(parent,) + path: total for path, total in self.totals.items()}
+
+    def summary(self, wall_seconds):
+        """Phases in start order with self time (excluding children), share of the run and rows/s."""
+        with self.lock:
+            totals = {path: dict(total) for path, total in self.totals.items()}
+        result = []
+        for path, total in totals.items():
+            children = sum(t["seconds"] for p, t in totals.items() if len(p) == len(path) + 1 and p[:-1] == path)
+            entry = dict(total, name=path[-1], path=";".join(path), depth=len(path) - 1,
+                         self_seconds=max(total["seconds"] - children, 0.0),
+                         share=total["seconds"] / wall_seconds if wall_seconds else 0.0)
+            if total["rows"] is not None and total["seconds"] > 0:
+                entry["rows_per_second"] = total["rows"] / total["seconds"]
+            result.append(entry)
+        return _tree_order(result)
+
+def _tree_order(entries):
+    # Insertion order is completion order (children before parents); list each parent before its children
+    by_parent = {}
+    for entry in entries:
+        by_parent.setdefault(entry["path"].rpartition(";")[0], []).append(entry)
+    ordered = []
+    def visit(parent):
+        for entry in by_parent.get(parent, ()):
+            ordered.append(entry)
+            visit(entry["path"])
+    visit("")
+    return ordered
+
+phases = Phases()
+
+def phase(name, rows=None):
+    """Time a block as a named phase (nested phases are timed under it)::
+
+        with profiling.phase("load cases") as p:
+            cases = load_cases(path)
+            p.rows = len(cases)
+    """
+    return phases.phase(name, rows)
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Sampler:
+    """Samples one thread's Python stack every interval seconds from a background thread.
+
+    Stacks are counted in folded form ("outer;...;inner"), prefixed with the
+    phases that were running, so a flame graph groups them by phase.
+    """
+
+    def __init__(self, ident=None, interval=SAMPLE_INTERVAL):
+        self.ident = ident or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(phases.current(self.ident) + labels[::-1])] += 1
+            self.samples += 1
+
+class Session:
+    """One profiled run: phase timings plus an optional sampling or cProfile trace, written to directory."""
+
+    def __init__(self, directory, trace="none", name=None):
+        if trace not in TRACES:
+            raise ValueError(f"unknown trace {trace!r}")
+        self.directory = directory
+        self.trace = trace
+        self.name = name or os.path.basename(sys.argv[0])
+        self.sampler = None
+        self.profiler = None
+
+    def start(self):
+        # Everything before this point happened while the entry point was starting up
+        now = time.perf_counter()
+        phases.reparent("startup")
+        phases.add(("startup",), now - _started, time.process_time())
+        if self.trace == "sample":
+            self.sampler = Sampler().start()
+        elif self.trace == "cprofile":
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def finish(self):
+        """Stop tracing and write profile.json, profile.folded and any trace; returns the summary."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        wall = time.perf_counter() - _started
+        summary = {
+            "command": [self.name] + sys.argv[1:],
+            "wall_seconds": wall,
+            "cpu_seconds": time.process_time(),
+            "trace": self.trace,
+            "phases": phases.summary(wall),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Phase self times in microseconds as folded stacks; sampled stacks go to their own file
+        folded = Counter()
+        for entry in summary["phases"]:
+            folded[entry["path"]] += int(entry["self_seconds"] * 1e6)
+        if self.sampler is not None:
+            summary["samples"] = self.sampler.samples
+            summary["sample_interval"] = self.sampler.interval
+            write_folded(os.path.join(self.directory, "samples.folded"), self.sampler.stacks)
+        write_folded(os.path.join(self.directory, "profile.folded"), folded)
+        if self.profiler is not None:
+            import pstats
+            self.profiler.dump_stats(os.path.join(self.directory, "profile.prof"))
+            with open(os.path.join(self.directory, "profile.txt"), "w") as f:
+                pstats.Stats(self.profiler, stream=f).sort_stats("cumulative").print_stats(40)
+
+        with open(os.path.join(self.directory, "profile.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+def write_folded(path, stacks):
+    """One "frame;frame;frame count" line per stack, the input format of flamegraph.pl and speedscope."""
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            if count > 0:
+                f.write(f"{stack} {count}\n")
+
+def print_summary(summary):
+    print(f"\n⏱️  Profile: {summary['wall_seconds']:.2f}s wall, {summary['cpu_seconds']:.2f}s CPU")
+    for entry in summary["phases"]:
+        name = "  " * entry["depth"] + entry["name"]
+        line = f"  {name:<32} {entry['seconds']:8.3f}s {entry['share']:6.1%}"
+        if "rows_per_second" in entry:
+            line += f"  {entry['rows']:,} rows  {entry['rows_per_second']:,.0f} rows/s"
+        print(line)
+
+_session = None
+
+def start(directory, trace="none", name=None):
+    """Begin profiling this process (see Session); entry points call this for --profile."""
+    global _session
+    _session = Session(directory, trace, name).start()
+    return _session
+
+def finish():
+    """Write the started session's output and print its phase table."""
+    global _session
+    session, _session = _session, None
+    summary = session.finish()
+    print_summary(summary)
+    print(f"📊 Profile saved to {session.directory}")
+    return summary
+
+def add_arguments(parser):
+    """The --profile options shared by the batch entry points."""
+    parser.add_argument("--profile", metavar="DIR",
+                        help="time each phase and write profile.json and folded stacks (profile.folded) to DIR")
+    parser.add_argument("--profile-trace", choices=TRACES, default="none",
+                        help="also sample the stack every 5 ms (samples.folded) or run cProfile (profile.prof)")
@@ -0,0 +1,144 @@
+import argparse
+import gc
+import os
+import signal
+import socketserver
+import sys
+
+def parse_request(line):
+    """Parse a `days miles receipts` request line the same way the CLI parses argv."""
+    parts = line.split()
+    if len(parts) != 3:
+        raise ValueError("expected 3 fields")
+    return int(parts[0]), float(parts[1]), float(parts[2])
+
+def handle_line(predict, line):
+    try:
+        days, miles, receipts = parse_request(line)
+    except ValueError:
+        return "Invalid input."
+    try:
+        return str(predict(days, miles, receipts))
+    except Exception:
+        return "ERROR"
+
+def serve_stream(predict, infile, outfile):
+    """Answer newline-delimited requests from infile, one line each, until EOF."""
+    for line in infile:
+        if not line.strip():
+            continue
+        outfile.write(handle_line(predict, line) + "\n")
+        outfile.flush()
+
+def _handler(predict):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode("utf-8", "replace")
+                if not line.strip():
+                    continue
+                self.wfile.write((handle_line(predict, line) + "\n").encode())
+                self.wfile.flush()
+    return Handler
+
+def serve_socket(predict, path):
+    """Answer newline-delimited requests on a Unix socket, one connection per thread."""
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, _handler(predict)) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def _worker(server):
+    # Connections are accepted by whichever worker wakes first; the others' accept fails
+    # with EAGAIN on the non-blocking listener and they go back to waiting
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server.socket.setblocking(False)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os._exit(0)
+
+def serve_prefork(predict, path, workers, warmup=None):
+    """Like serve_socket, but from `workers` processes forked from this one after it has loaded everything.
+
+    The tables and model arrays are memory-mapped or allocated before the fork,
+    so workers share them copy-on-write and start without loading anything.
+    warmup runs once before forking to build any state predict creates lazily.
+    A worker that exits is replaced; SIGTERM or Ctrl-C stops them all.
+    """
+    if warmup is not None:
+        warmup()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socketserver.ThreadingUnixStreamServer(path, _handler(predict))
+    server.daemon_threads = True
+
+    # Objects that exist now are never collected again, so garbage collection in the
+    # workers doesn't write to (and copy) the pages they share with this process
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _worker(server)
+        children.add(pid)
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        for _ in range(workers):
+            spawn()
+        while True:
+            pid, _ = os.wait()
+            children.discard(pid)
+            spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def serve_main(predict, argv, prog=None, warmup=None, socket_predict=None):
+    """Serve predict on stdin/stdout or a socket, as the command line asks.
+
+    socket_predict, if given, answers socket requests instead; stdin is read
+    one request at a time, so only concurrent connections gain from batching.
+    """
+    parser = argparse.ArgumentParser(prog=prog, description="Serve reimbursement requests with warm tables.")
+    parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="with --socket, fork this many worker processes that share the loaded state")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not args.socket:
+        parser.error("--workers needs --socket")
+
+    if args.socket and args.workers > 1:
+        serve_prefork(socket_predict or predict, args.socket, args.workers, warmup)
+    elif args.socket:
+        serve_socket(socket_predict or predict, args.socket)
+    else:
+        serve_stream(predict, sys.stdin, sys.stdout)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+SNAPSHOT_MAGIC = b"RSNP0001"
+SNAPSHOT_DIR = ".cache"
+_ALIGN = 64
+# Files changed less than this long before they are stamped are hashed rather than trusted (see _stamp)
+RACY_NS = 2_000_000_000
+# memoryview formats of the dtypes snapshots hold, for reading them without numpy
+_RAW_FORMATS = {"<i8": "q", "<f8": "d", "|u1": "B"}
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_path(source, suffix):
+    return os.path.join(SNAPSHOT_DIR, os.path.basename(source) + suffix)
+
+def _stamp(st):
+    """Size, mtime, ctime and inode of a stat result, or None while the file may still change unseen.
+
+    ctime and the inode change on every write, rename or utime, so a rewrite that
+    restores size and mtime (cp -p, touch -r) still changes the stamp. Timestamps
+    only tick every few milliseconds, though: like git's "racy" entries, a file
+    changed within RACY_NS of the stamp could change again without changing it,
+    so it gets no stamp and is hashed until it has been left alone.
+    """
+    if time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) < RACY_NS:
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino]
+
+def source_sha256(source):
+    """file_sha256 of source, remembered under .cache/ for as long as its stamp doesn't change."""
+    st = os.stat(source)
+    stamp, path = _stamp(st), cache_path(source, ".sha256")
+    if stamp is not None:
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            if cached["path"] == os.path.abspath(source) and cached["stamp"] == stamp:
+                return cached["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+    digest = file_sha256(source)
+    if stamp is not None:
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            tmp = f"{path}.tmp.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump({"path": os.path.abspath(source), "stamp": stamp, "sha256": digest}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return digest
+
+def source_info(source):
+    st = os.stat(source)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "stamp": _stamp(st), "sha256": source_sha256(source)}
+
+def is_current(header, source):
+    """Whether a snapshot header still describes the source file's contents.
+
+    An unchanged stamp (see _stamp) answers without reading the file; otherwise
+    the content hash decides, so a file rewritten with the same size and mtime
+    is still detected and one merely touched is still current.
+    """
+    cached = header.get("source", {})
+    st = os.stat(source)
+    if cached.get("size") != st.st_size:
+        return False
+    if cached.get("stamp") is not None and cached["stamp"] == _stamp(st):
+        return True
+    return cached.get("sha256") == source_sha256(source)
+
+def ingested_path(source):
+    """NDJSON log of the cases ingest.py has appended to a case file."""
+    return os.path.splitext(source)[0] + ".ingested.jsonl"
+
+def data_fingerprint(source):
+    """Content hashes of a case file and its ingest log (None without one), as lookup snapshots check them."""
+    log = ingested_path(source)
+    return source_sha256(source), source_sha256(log) if os.path.exists(log) else None
+
+def _data_start(header_len):
+    return -(-(len(SNAPSHOT_MAGIC) + 8 + header_len) // _ALIGN) * _ALIGN
+
+def write_snapshot(path, arrays, metadata):
+    """Write named 1-D arrays plus a JSON metadata header into one aligned file, atomically."""
+    import numpy as np
+
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        entries[name] = {"dtype": array.dtype.str, "count": len(array), "offset": offset}
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps(dict(metadata, arrays=entries)).encode()
+    data_start = _data_start(len(header))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+def read_snapshot(path, raw=False):
+    """Open a snapshot with mmap; returns (header, {name: read-only array view}).
+
+    With raw the views are memoryviews, so numpy isn't imported (run.py's
+    one-shot CLI); np.asarray turns them into arrays without a copy.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        data_start = _data_start(header_len)
+        size = os.fstat(f.fileno()).st_size
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        fmt = _RAW_FORMATS.get(entry["dtype"]) if raw and sys.byteorder == "little" else None
+        if fmt is not None:
+            start = data_start + entry["offset"]
+            view = memoryview(buf)[start:start + entry["count"] * struct.calcsize(fmt)]
+            if len(view) != entry["count"] * struct.calcsize(fmt):
+                raise ValueError(f"{path} is truncated")
+            arrays[name] = view.cast(fmt)
+            continue
+        import numpy as np
+        dtype = np.dtype(entry["dtype"])
+        if entry["count"]:
+            arrays[name] = np.frombuffer(buf, dtype=dtype, count=entry["count"],
+                                         offset=data_start + entry["offset"])
+        else:
+            arrays[name] = np.zeros(0, dtype=dtype)
+    return header, arrays
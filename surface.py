@@ -0,0 +1,204 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from lookup_tables import round2
+from snapshot import SNAPSHOT_DIR, read_snapshot, write_snapshot
+
+# Default grid: whole trip days, miles and receipts every $10 / 10 miles.
+# Steps that divide the rule breakpoints (50, 150, 600, 800) keep the
+# rule fallback's kinks on grid lines.
+DEFAULT_AXES = {"days": (1, 30, 1), "miles": (0, 3000, 10), "receipts": (0, 5000, 10)}
+PREDICTORS = ("rules", "run", "private")
+
+def source_predictor(name):
+    """Batch predict function (days, miles, receipts columns -> array) for a predictor name."""
+    if name == "rules":
+        from run import rule_based_batch
+        return lambda days, miles, receipts: rule_based_batch(np.asarray(days, dtype=np.float64),
+                                                              np.asarray(miles, dtype=np.float64),
+                                                              np.asarray(receipts, dtype=np.float64))
+    if name == "run":
+        from run import calculate_reimbursement_batch
+        return calculate_reimbursement_batch
+    if name == "private":
+        from private_run import predictor
+        return predictor.predict_many
+    raise ValueError(f"unknown predictor {name!r}")
+
+def axis_points(start, stop, step):
+    return start + step * np.arange(int(round((stop - start) / step)) + 1)
+
+class Surface:
+    """A predictor sampled on a regular 3D grid, answered by trilinear interpolation.
+
+    values is a flat float32 array in (days, miles, receipts) C order; axes
+    holds (start, step, count) per dimension. Queries outside the grid are
+    reported through the `inside` mask rather than extrapolated.
+    """
+
+    def __init__(self, values, axes, header=None):
+        self.values = values
+        self.axes = [tuple(axis) for axis in axes]
+        self.header = header or {}
+        self.source = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def query(self, days, miles, receipts):
+        """Interpolated values (unrounded) and a mask of queries inside the grid."""
+        coords = [np.asarray(days, dtype=np.float64).ravel(), np.asarray(miles, dtype=np.float64).ravel(),
+                  np.asarray(receipts, dtype=np.float64).ravel()]
+        inside = np.ones(len(coords[0]), dtype=bool)
+        lower, frac = [], []
+        for x, (start, step, count) in zip(coords, self.axes):
+            t = (x - start) / step
+            with np.errstate(invalid="ignore"):
+                inside &= (t >= 0) & (t <= count - 1)
+            i = np.clip(np.floor(np.nan_to_num(t)), 0, max(count - 2, 0)).astype(np.int64)
+            lower.append(i)
+            frac.append(np.clip(np.nan_to_num(t) - i, 0, 1) if count > 1 else np.zeros(len(x)))
+
+        (i0, i1, i2), (f0, f1, f2) = lower, frac
+        n1, n2 = self.axes[1][2], self.axes[2][2]
+        d0, d1, d2 = (1 if self.axes[0][2] > 1 else 0), (1 if n1 > 1 else 0), (1 if n2 > 1 else 0)
+        base = (i0 * n1 + i1) * n2 + i2
+        result = np.zeros(len(base))
+        for a in (0, 1):
+            for b in (0, 1):
+                for c in (0, 1):
+                    weight = ((f0 if a else 1 - f0) * (f1 if b else 1 - f1) * (f2 if c else 1 - f2))
+                    corner = self.values[base + (a * d0 * n1 + b * d1) * n2 + c * d2]
+                    result += weight * corner
+        return result, inside
+
+    def predict_batch(self, days, miles, receipts, fallback="source"):
+        """Rounded predictions; rows outside the grid go to fallback.
+
+        fallback is a batch predictor, "source" for the predictor the surface
+        was built from (loaded on first use), or None to return NaN.
+        """
+        result, inside = self.query(days, miles, receipts)
+        result = round2(result)
+        if not inside.all():
+            outside = ~inside
+            if fallback == "source":
+                if self.source is None:
+                    self.source = source_predictor(self.header["predictor"])
+                fallback = self.source
+            if fallback is None:
+                result[outside] = np.nan
+            else:
+                cols = [np.asarray(c, dtype=np.float64).ravel()[outside] for c in (days, miles, receipts)]
+                result[outside] = fallback(*cols)
+        return result
+
+    def predict(self, trip_days, miles, receipts):
+        return float(self.predict_batch([trip_days], [miles], [receipts])[0])
+
+def build_surface(predict, axes=DEFAULT_AXES):
+    """Evaluate predict on every grid point, one days-slice at a time."""
+    points = [axis_points(*axes[name]) for name in ("days", "miles", "receipts")]
+    days, miles, receipts = points
+    values = np.empty((len(days), len(miles), len(receipts)), dtype=np.float32)
+    m, r = np.meshgrid(miles, receipts, indexing="ij")
+    for i, d in enumerate(days.tolist()):
+        values[i] = np.asarray(predict(np.full(m.size, d), m.ravel(), r.ravel())).reshape(m.shape)
+    spec = [(float(p[0]), float(axes[name][2]), len(p)) for p, name in zip(points, ("days", "miles", "receipts"))]
+    return Surface(values.ravel(), spec)
+
+def measure_error(surface, predict, samples=100_000, seed=0):
+    """Absolute error of the surface against its source on random in-grid queries.
+
+    Days are drawn as whole days (as served); miles and receipts are
+    continuous, with receipts rounded to cents.
+    """
+    rng = np.random.default_rng(seed)
+    (d0, _, dn), (m0, ms, mn), (r0, rs, rn) = surface.axes
+    days = rng.integers(int(d0), int(d0) + dn, samples).astype(np.float64)
+    miles = rng.uniform(m0, m0 + ms * (mn - 1), samples)
+    receipts = np.round(rng.uniform(r0, r0 + rs * (rn - 1), samples), 2)
+    approx = surface.predict_batch(days, miles, receipts, fallback=None)
+    error = np.abs(approx - np.asarray(predict(days, miles, receipts), dtype=np.float64))
+    return {
+        "samples": samples,
+        "max": float(error.max()),
+        "p99": float(np.percentile(error, 99)),
+        "p95": float(np.percentile(error, 95)),
+        "mean": float(error.mean()),
+        "within_1c": float((error <= 0.01).mean()),
+    }
+
+def surface_path(predictor):
+    return os.path.join(SNAPSHOT_DIR, f"{predictor}.surface")
+
+def save_surface(surface, path, metadata):
+    write_snapshot(path, {"values": surface.values}, dict(metadata, axes=surface.axes))
+
+def load_surface(path):
+    """Open a stored surface; the grid values stay memory-mapped."""
+    header, arrays = read_snapshot(path)
+    return Surface(arrays["values"], header["axes"], header)
+
+def _axis(text):
+    parts = [float(p) for p in text.split(":")]
+    if len(parts) == 2:
+        parts.append(1.0)
+    if len(parts) != 3 or parts[2] <= 0 or parts[1] < parts[0]:
+        raise argparse.ArgumentTypeError("expected start:stop[:step]")
+    return tuple(parts)
+
+def _print_error(error):
+    print(f"📏 Error vs source over {error['samples']} random queries:")
+    print(f"  max: ${error['max']:.2f}  p99: ${error['p99']:.2f}  p95: ${error['p95']:.2f}  "
+          f"mean: ${error['mean']:.4f}  within 1¢: {error['within_1c']:.1%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute a predictor on a 3D grid and serve it by interpolation.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="evaluate a predictor on the grid and store it")
+    build.add_argument("--predictor", choices=PREDICTORS, default="rules")
+    build.add_argument("--days", type=_axis, default=DEFAULT_AXES["days"], help="start:stop[:step]")
+    build.add_argument("--miles", type=_axis, default=DEFAULT_AXES["miles"], help="start:stop[:step]")
+    build.add_argument("--receipts", type=_axis, default=DEFAULT_AXES["receipts"], help="start:stop[:step]")
+    build.add_argument("--samples", type=int, default=100_000, help="random queries used to measure the error")
+    build.add_argument("--output", help="surface file (default: .cache/<predictor>.surface)")
+
+    check = commands.add_parser("check", help="re-measure a stored surface against its predictor")
+    check.add_argument("path")
+    check.add_argument("--samples", type=int, default=100_000)
+
+    query = commands.add_parser("query", help="answer one query from a stored surface")
+    query.add_argument("path")
+    query.add_argument("values", nargs=3, type=float, metavar="N")
+
+    serve = commands.add_parser("serve", help="answer `days miles receipts` lines from a stored surface")
+    serve.add_argument("path")
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "build":
+        axes = {"days": args.days, "miles": args.miles, "receipts": args.receipts}
+        predict = source_predictor(args.predictor)
+        started = time.perf_counter()
+        surface = build_surface(predict, axes)
+        print(f"🧮 Evaluated {args.predictor} on {len(surface)} grid points in {time.perf_counter() - started:.1f}s")
+        error = measure_error(surface, predict, args.samples)
+        _print_error(error)
+        path = args.output or surface_path(args.predictor)
+        save_surface(surface, path, {"predictor": args.predictor, "error": error})
+        print(f"✅ Saved {surface.values.nbytes / 1e6:.1f} MB surface to {path}")
+    elif args.command == "check":
+        surface = load_surface(args.path)
+        _print_error(measure_error(surface, source_predictor(surface.header["predictor"]), args.samples))
+    elif args.command == "query":
+        print(load_surface(args.path).predict(*args.values))
+    else:
+        from serve import serve_main
+        serve_main(load_surface(args.path).predict, rest, prog="surface.py serve")
+
+if __name__ == "__main__":
+    main()
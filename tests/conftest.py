@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts use paths relative to the repo root (public_cases.json, .cache/) and import each other flat
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+
+from cases import CaseSet, load_cases
+from generate_results import score_chunk
+from run import calculate_reimbursement
+
+RECORDS = [
+    {"trip_duration_days": 3, "miles_traveled": 93, "total_receipts_amount": 1.42},
+    {"trip_duration_days": None, "miles_traveled": 93, "total_receipts_amount": 1.42},
+    {"trip_duration_days": 5, "miles_traveled": "200", "total_receipts_amount": 500},
+    {"miles_traveled": 200, "total_receipts_amount": 500},
+    {"trip_duration_days": 10 ** 400, "miles_traveled": 200, "total_receipts_amount": 500},
+    "not a case",
+    {"trip_duration_days": 5, "miles_traveled": 200, "total_receipts_amount": 500.5},
+]
+MALFORMED = [False, True, True, True, True, True, False]
+
+def _expected_lines():
+    return [f"{calculate_reimbursement(3, 93, 1.42):.2f}"] + ["ERROR"] * 5 + [f"{calculate_reimbursement(5, 200, 500.5):.2f}"]
+
+def test_malformed_rows_are_flagged_not_raised():
+    cases = CaseSet.from_records(RECORDS)
+    assert cases.invalid.astype(bool).tolist() == MALFORMED
+    assert np.isnan(cases.miles[1:6]).all()
+    assert cases.miles[[0, 6]].tolist() == [93, 200]
+    # The mask follows the rows through slicing and concatenation
+    assert cases[1:3].invalid.tolist() == [1, 1]
+    assert CaseSet.concat([cases[5:], cases[:1]]).invalid.tolist() == [1, 0, 0]
+
+def test_score_chunk_writes_error_per_malformed_row():
+    assert score_chunk(CaseSet.from_records(RECORDS), progress=False) == _expected_lines()
+
+def test_invalid_mask_survives_the_case_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("cases.json", "w") as f:
+        json.dump(RECORDS, f)
+    load_cases("cases.json")
+    cached = load_cases("cases.json")
+    assert cached.invalid.astype(bool).tolist() == MALFORMED
+    assert score_chunk(cached, progress=False) == _expected_lines()
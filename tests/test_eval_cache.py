@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+import eval_cache
+
+def test_fingerprint_covers_lazily_imported_modules(monkeypatch):
+    hashed = []
+    file_sha256 = eval_cache.file_sha256
+    monkeypatch.setattr(eval_cache, "file_sha256", lambda path: hashed.append(os.path.basename(path)) or file_sha256(path))
+    # As in a fresh eval.py process, where knn scoring hasn't imported neighbors yet
+    monkeypatch.delitem(sys.modules, "neighbors", raising=False)
+    eval_cache.fingerprint("knn", "public_cases.json")
+    assert {"run.py", "lookup_tables.py", "neighbors.py"} <= set(hashed)
+
+def test_saving_predictions_leaves_the_history_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(eval_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(eval_cache, "HISTORY_PATH", str(tmp_path / "history.json"))
+    outputs = np.arange(3, dtype=np.float64)
+    eval_cache.save_predictions("a" * 64, outputs, "run", "public_cases.json")
+    assert np.array_equal(eval_cache.load_predictions("a" * 64), outputs)
+    assert eval_cache.previous_run("b" * 64, "run", "public_cases.json") is None
+
+    eval_cache.record_run("a" * 64, "run", "public_cases.json")
+    key, previous = eval_cache.previous_run("b" * 64, "run", "public_cases.json")
+    assert key == "a" * 64 and np.array_equal(previous, outputs)
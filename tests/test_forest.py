@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import forest
+from cases import load_cases
+from forest import CompiledForest
+from private_run import build_model, load_model_params
+
+@pytest.fixture(scope="module")
+def pipeline():
+    cases = load_cases("public_cases.json")
+    model = build_model(dict(load_model_params(), n_estimators=20))
+    model.fit(np.column_stack(cases.columns()).astype(np.float64), cases.expected)
+    return model
+
+def _inputs():
+    cases = load_cases("public_cases.json")
+    rng = np.random.default_rng(0)
+    n = 2000
+    random = np.column_stack([rng.integers(1, 15, n), np.round(rng.uniform(0, 1500, n), 1),
+                              np.round(rng.uniform(0, 2500, n), 2)]).astype(np.float64)
+    # The training rows themselves plus random rows between them
+    return np.vstack([np.column_stack(cases.columns()).astype(np.float64), random])
+
+def _assert_bit_identical(actual, expected):
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual.view(np.uint64), expected.view(np.uint64))
+
+def test_batch_predict_matches_sklearn(pipeline, monkeypatch):
+    X = _inputs()
+    expected = pipeline.predict(X)
+    compiled = CompiledForest.from_pipeline(pipeline)
+    _assert_bit_identical(compiled.predict(X), expected)
+    # Small blocks exercise the blocked traversal
+    monkeypatch.setattr(forest, "BLOCK_CELLS", 20 * 7)
+    _assert_bit_identical(compiled.predict(X), expected)
+
+def test_single_row_predict_matches_sklearn(pipeline):
+    X = _inputs()[::25]
+    compiled = CompiledForest.from_pipeline(pipeline)
+    _assert_bit_identical([compiled.predict_one(*row) for row in X.tolist()], pipeline.predict(X))
+    _assert_bit_identical([compiled.predict([row])[0] for row in X.tolist()], pipeline.predict(X))
+
+def test_saved_forest_matches_sklearn(pipeline, tmp_path):
+    X = _inputs()
+    path = str(tmp_path / "model.forest")
+    CompiledForest.from_pipeline(pipeline).save(path, {"fingerprint": "test"})
+    header, loaded = CompiledForest.load(path)
+    assert header["fingerprint"] == "test"
+    _assert_bit_identical(loaded.predict(X), pipeline.predict(X))
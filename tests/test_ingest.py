@@ -0,0 +1,105 @@
+import json
+import os
+
+import lookup_tables
+
+import numpy as np
+import pytest
+
+from cases import load_training_cases
+from ingest import append_cases
+from lookup_tables import (build_arrays, build_tables, effective_arrays, exact_keys, load_lookup_tables,
+                           pattern_keys, read_current_snapshot)
+from neighbors import load_neighbor_index
+from snapshot import ingested_path
+
+@pytest.fixture
+def records():
+    with open("public_cases.json") as f:
+        return json.load(f)
+
+@pytest.fixture
+def source(tmp_path, monkeypatch, records):
+    monkeypatch.chdir(tmp_path)
+    with open("cases.json", "w") as f:
+        json.dump(records[:600], f)
+    return "cases.json"
+
+def _assert_matches_full_rebuild(source):
+    current = read_current_snapshot(source)
+    assert current is not None
+    header, arrays, deltas = current
+    arrays = effective_arrays(arrays, deltas)
+    cases = load_training_cases(source)
+    expected, overflow = build_arrays(cases.days, cases.miles, cases.receipts, cases.expected, cases.expected_is_int)
+    assert set(arrays) == set(expected)
+    for name, array in expected.items():
+        assert arrays[name].dtype == array.dtype, name
+        assert np.array_equal(arrays[name].view(np.uint8), array.view(np.uint8)), name
+    assert not overflow["exact"] and not overflow["pattern"]
+
+def test_ingested_arrays_match_a_full_rebuild(source, records):
+    append_cases(records[600:800], source, model=False)
+    append_cases(records[800:], source, model=False)
+    assert len(load_training_cases(source)) == len(records)
+    _assert_matches_full_rebuild(source)
+
+def test_partial_last_line_is_ignored_and_cut_before_the_next_append(source, records):
+    append_cases(records[600:800], source, model=False)
+    log = ingested_path(source)
+    size = os.path.getsize(log)
+    # A crash in the middle of writing the next batch
+    with open(log, "a") as f:
+        f.write(json.dumps(records[800])[:30])
+    assert len(load_training_cases(source)) == 800
+
+    append_cases(records[800:], source, model=False)
+    with open(log) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == len(records) - 600
+    assert all(json.loads(line) for line in lines)
+    assert os.path.getsize(log) > size
+    _assert_matches_full_rebuild(source)
+
+def test_neighbor_index_follows_ingested_cases(source, records):
+    assert len(load_neighbor_index(source)) == 600
+    append_cases(records[600:], source, model=False)
+    assert len(load_neighbor_index(source)) == len(records)
+
+def test_appends_write_delta_segments_until_compacted(source, records, monkeypatch):
+    monkeypatch.setattr(lookup_tables, "MAX_DELTAS", 3)
+    monkeypatch.setattr(lookup_tables, "DELTA_SHARE", 10.0)
+    append_cases(records[600:620], source, model=False)
+    main = os.path.join(".cache", "cases.json.lookup")
+    with open(main, "rb") as f:
+        before = f.read()
+
+    for lo in range(620, 1000, 20):
+        append_cases(records[lo:lo + 20], source, model=False)
+        _assert_matches_full_rebuild(source)
+        assert 1 <= len(read_current_snapshot(source)[2]) < 3
+    with open(main, "rb") as f:
+        assert f.read() == before
+    # Compacted segments are removed, leaving at most MAX_DELTAS - 1 files
+    assert len([name for name in os.listdir(".cache") if ".lookup.delta." in name]) < 3
+
+    cases = load_training_cases(source)
+    exact, pattern = load_lookup_tables(source)
+    rebuilt_exact, rebuilt_pattern = build_tables(cases.days, cases.miles, cases.receipts, cases.expected,
+                                                  cases.expected_is_int)
+    keys = list(zip(cases.days.tolist(), cases.miles.tolist(), cases.receipts.tolist()))
+    assert [exact.get(k) for k in keys] == [rebuilt_exact.get(k) for k in keys]
+    assert len(exact) == len(rebuilt_exact) and len(pattern) == len(rebuilt_pattern)
+    assert np.array_equal(pattern.counts, rebuilt_pattern.counts)
+    for days, miles, receipts in keys:
+        for key in [(days, round(miles / 50) * 50, round(receipts / 100) * 100),
+                    (round(days / 2) * 2, round(miles / 100) * 100, round(receipts / 50) * 50)]:
+            assert pattern.get(key) == rebuilt_pattern.get(key)
+
+    columns = [np.asarray(c, dtype=np.float64) for c in cases.columns()]
+    for table, rebuilt, (packed, valid) in [(exact, rebuilt_exact, exact_keys(*columns)),
+                                            (pattern, rebuilt_pattern, pattern_keys(*columns)[:2])]:
+        found, values = table.probe(packed, valid)
+        rebuilt_found, rebuilt_values = rebuilt.probe(packed, valid)
+        assert np.array_equal(found, rebuilt_found)
+        assert np.array_equal(values[found], rebuilt_values[found])
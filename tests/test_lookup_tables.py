@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+
+from cases import load_cases
+from lookup_tables import build_tables, exact_keys, pack_keys, pattern_keys
+from packed_table import pack_key
+
+def _dict_tables(records):
+    # The original dict-based tables of run.py
+    exact, buckets = {}, {}
+    for case in records:
+        t, m, r = (case["input"][k] for k in ("trip_duration_days", "miles_traveled", "total_receipts_amount"))
+        output = case["expected_output"]
+        exact[(t, round(m), round(r, 2))] = output
+        for key in [(t, round(m / 50) * 50, round(r / 100) * 100),
+                    (round(t / 2) * 2, round(m / 100) * 100, round(r / 50) * 50)]:
+            buckets.setdefault(key, []).append(output)
+    return exact, {key: sum(values) / len(values) for key, values in buckets.items()}
+
+def _public_tables():
+    cases = load_cases("public_cases.json")
+    return build_tables(cases.days, cases.miles, cases.receipts, cases.expected, cases.expected_is_int)
+
+def test_scalar_lookups_match_dicts():
+    with open("public_cases.json") as f:
+        records = json.load(f)
+    exact_dict, pattern_dict = _dict_tables(records)
+    exact, pattern = _public_tables()
+    for table, expected in ((exact, exact_dict), (pattern, pattern_dict)):
+        assert len(table) == len(expected)
+        for key, value in expected.items():
+            assert key in table
+            assert table[key] == value and type(table[key]) is type(value)
+    assert (3, 93, 1.43) not in exact and exact.get((3, 93, 1.43)) is None
+    assert (3.0, 93, 1.42) in exact and (2.5, 93, 1.42) not in exact
+
+def test_scalar_lookups_match_probe():
+    exact, pattern = _public_tables()
+    rng = np.random.default_rng(0)
+    n = 5_000
+    days = rng.integers(1, 15, n).astype(np.float64)
+    miles = np.rint(rng.uniform(0, 1500, n))
+    receipts = np.round(rng.uniform(0, 2500, n), 2)
+    keys, valid = exact_keys(days, miles, receipts)
+    found, values = exact.probe(keys, valid)
+    for i, key in enumerate(zip(days.tolist(), miles.tolist(), receipts.tolist())):
+        assert (key in exact) == found[i]
+        if found[i]:
+            assert exact[key] == values[i]
+    key1, valid1, _, _ = pattern_keys(days, miles, receipts)
+    found, values = pattern.probe(key1, valid1)
+    for i, (d, m, r) in enumerate(zip(days.tolist(), miles.tolist(), receipts.tolist())):
+        key = (d, round(m / 50) * 50, round(r / 100) * 100)
+        assert pattern.get(key, np.nan) == values[i] or not found[i]
+
+def test_unpackable_keys_use_overflow():
+    exact, pattern = build_tables(np.array([-1.0, 3.0]), np.array([14.3, 93.0]), np.array([966.7, 1.42]),
+                                  np.array([100.0, 200.0]), np.array([1, 1], dtype=np.uint8))
+    assert exact[(-1, 14, 966.7)] == 100 and exact[(3, 93, 1.42)] == 200
+    assert len(exact) == 2
+
+def test_pack_key_matches_pack_keys():
+    rng = np.random.default_rng(1)
+    n = 5_000
+    days = np.r_[rng.integers(-2, 4100, n), 3.5, 2.0 ** 12, np.nan, np.inf].astype(np.float64)
+    miles = np.r_[rng.integers(-2, 2000, n), 14.3, 2.0 ** 24, 93, 93].astype(np.float64)
+    amounts = np.r_[[round(a, d) for a, d in zip(rng.uniform(-1, 5000, n).tolist(), rng.integers(0, 4, n).tolist())],
+                    1.42, 1.42, 1.42, 1.42]
+    packed, valid = pack_keys(days, miles, amounts)
+    for i, key in enumerate(zip(days.tolist(), miles.tolist(), amounts.tolist())):
+        assert pack_key(key) == (int(packed[i]) if valid[i] else None)
+        int_key = tuple(int(v) if v == v and abs(v) != np.inf and v == int(v) else v for v in key[:2]) + key[2:]
+        assert pack_key(int_key) == pack_key(key)
+    assert pack_key(("3", 93, 1.42)) is None and pack_key((3, 93)) is None
@@ -0,0 +1,37 @@
+import gc
+import weakref
+
+import memo
+from cases import load_cases
+from private_run import ReimbursementPredictor
+
+def test_refit_invalidates_memoized_predictions():
+    cases = load_cases("public_cases.json")
+    predictor = ReimbursementPredictor()
+    query = (4, 321.5, 777.77)
+
+    predictor.fit(cases[:300])
+    first = predictor.predict(*query)
+    assert predictor.predict(*query) == first
+    assert predictor._predict_cached.cache_info().hits == 1
+
+    predictor.fit(cases[300:600])
+    assert predictor._predict_cached.cache_info().currsize == 0
+    assert predictor.predict(*query) == predictor._predict(*query)
+    assert predictor.predict(*query) != first
+
+def test_registry_counts_each_instance_without_keeping_it_alive():
+    cases = load_cases("public_cases.json")[:100]
+    predictors = [ReimbursementPredictor().fit(cases) for _ in range(2)]
+    gc.collect()
+    before = memo.stats()["ReimbursementPredictor.predict"]
+    for predictor in predictors:
+        predictor.predict(4, 321.5, 777.77)
+    after = memo.stats()["ReimbursementPredictor.predict"]
+    assert after["misses"] - before["misses"] == 2
+
+    ref = weakref.ref(predictors.pop())
+    del predictor
+    gc.collect()
+    assert ref() is None
+    assert memo.stats()["ReimbursementPredictor.predict"]["caches"] == before["caches"] - 1
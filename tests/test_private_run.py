@@ -0,0 +1,48 @@
+import threading
+import time
+
+from cases import load_cases
+from private_run import MicroBatcher, ReimbursementPredictor
+
+class RecordingPredictor:
+    """Answers each row with a value derived from it, recording the batches it was given."""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_rows(self, rows):
+        self.batches.append(len(rows))
+        time.sleep(0.001)
+        return [days * 1_000_000 + miles * 1_000 + receipts for days, miles, receipts in rows]
+
+def _call_concurrently(predict, rows):
+    results = [None] * len(rows)
+    start = threading.Barrier(len(rows))
+
+    def call(i):
+        start.wait()
+        results[i] = predict(*rows[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_each_caller_gets_its_own_result():
+    predictor = RecordingPredictor()
+    rows = [(i % 14 + 1, i, i / 4) for i in range(200)]
+    results = _call_concurrently(MicroBatcher(predictor, max_wait=0.01, max_batch=32).predict, rows)
+    assert results == [d * 1_000_000 + m * 1_000 + r for d, m, r in rows]
+    assert sum(predictor.batches) == len(rows)
+    assert max(predictor.batches) > 1
+    assert max(predictor.batches) <= 32
+
+def test_batched_answers_match_predict():
+    cases = load_cases("public_cases.json")
+    predictor = ReimbursementPredictor().fit(cases[:200])
+    rows = [(i % 14 + 1, 10.0 * i, 7.5 * i) for i in range(48)] + list(zip(
+        cases.days[:16].tolist(), cases.miles[:16].tolist(), cases.receipts[:16].tolist()))
+    results = _call_concurrently(MicroBatcher(predictor).predict, rows)
+    assert results == [predictor.predict(*row) for row in rows]
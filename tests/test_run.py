@@ -0,0 +1,63 @@
+import numpy as np
+
+import run
+from cases import load_cases
+
+def _scalar(days, miles, receipts, **kwargs):
+    return np.array([run.calculate_reimbursement(d, m, r, **kwargs)
+                     for d, m, r in zip(days.tolist(), miles.tolist(), receipts.tolist())])
+
+def _assert_bit_identical(a, b):
+    assert np.array_equal(np.asarray(a).view(np.uint64), np.asarray(b).view(np.uint64))
+
+def test_batch_matches_scalar_on_public_cases():
+    cases = load_cases("public_cases.json")
+    columns = [np.asarray(c, dtype=np.float64) for c in cases.columns()]
+    _assert_bit_identical(run.calculate_reimbursement_batch(*columns), _scalar(*columns))
+
+def test_batch_matches_scalar_on_random_inputs():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    days = rng.integers(1, 15, n).astype(np.float64)
+    miles = rng.uniform(0, 1500, n)
+    miles = np.where(rng.random(n) < 0.5, np.rint(miles), np.round(miles, 1))
+    receipts = np.round(rng.uniform(0, 2500, n), 2)
+    _assert_bit_identical(run.calculate_reimbursement_batch(days, miles, receipts), _scalar(days, miles, receipts))
+
+def test_batch_matches_scalar_on_unpackable_rows():
+    # Negative or fractional days, huge miles and sub-cent receipts can't be packed and take the scalar path
+    rng = np.random.default_rng(1)
+    n = 5_000
+    days = rng.choice([-3.0, -1.0, 0.0, 2.5, 4096.0, 7.0], n)
+    miles = np.round(rng.uniform(-100, 2000, n), 1)
+    miles[::7] = 2.0 ** 25
+    receipts = np.round(rng.uniform(-50, 2500, n), 1)
+    receipts[::5] += 0.001
+    _assert_bit_identical(run.calculate_reimbursement_batch(days, miles, receipts), _scalar(days, miles, receipts))
+    _assert_bit_identical(run.calculate_reimbursement_batch([-1], [14.3], [966.7]),
+                          [run.calculate_reimbursement(-1.0, 14.3, 966.7)])
+
+def test_batch_matches_scalar_with_tuned_params():
+    params = dict(run.DEFAULT_PARAMS, per_diem=101, receipt_cap=700)
+    days, miles, receipts = np.array([3.0, -1.0, 9.0]), np.array([14.3, 14.3, 812.0]), np.array([966.7, 966.7, 10.0])
+    _assert_bit_identical(run.calculate_reimbursement_batch(days, miles, receipts, params),
+                          _scalar(days, miles, receipts, params=params))
+
+def test_knn_batch_matches_scalar():
+    days, miles, receipts = np.array([3.0, -1.0, 5.0]), np.array([93.0, 14.3, 250.0]), np.array([1.42, 966.7, 150.75])
+    expected = [run.calculate_reimbursement_knn(d, m, r)
+                for d, m, r in zip(days.tolist(), miles.tolist(), receipts.tolist())]
+    _assert_bit_identical(run.calculate_reimbursement_knn_batch(days, miles, receipts), expected)
+
+def test_value_path_matches_resolve():
+    cases = load_cases("public_cases.json")
+    rng = np.random.default_rng(2)
+    rows = list(zip(cases.days.tolist(), cases.miles.tolist(), cases.receipts.tolist()))
+    rows += list(zip(rng.integers(-1, 15, 2000).tolist(), np.round(rng.uniform(0, 1500, 2000), 1).tolist(),
+                     np.round(rng.uniform(0, 2500, 2000), 2).tolist()))
+    params = dict(run.DEFAULT_PARAMS, per_diem=101)
+    for p in (run.DEFAULT_PARAMS, params):
+        values = [run.reimbursement(*row, params=p) for row in rows]
+        resolved = [run.resolve_reimbursement(*row, params=p)[0] for row in rows]
+        assert [type(v) for v in values] == [type(v) for v in resolved]
+        _assert_bit_identical(np.array(values, dtype=np.float64), np.array(resolved, dtype=np.float64))
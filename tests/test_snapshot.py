@@ -0,0 +1,90 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import snapshot
+
+from cases import load_cases
+from lookup_tables import load_lookup_tables, snapshot_path
+from snapshot import is_current, read_snapshot, source_info, write_snapshot
+
+def _write_cases(path, outputs):
+    records = [{"input": {"trip_duration_days": 3, "miles_traveled": 93 + i, "total_receipts_amount": 1.42},
+                "expected_output": output} for i, output in enumerate(outputs)]
+    with open(path, "w") as f:
+        json.dump(records, f)
+
+def test_round_trip(tmp_path):
+    arrays = {
+        "keys": np.array([1, 5, 2 ** 60], dtype=np.int64),
+        "values": np.array([0.1, np.nan, -3.5]),
+        "flags": np.array([1, 0, 1], dtype=np.uint8),
+        "empty": np.zeros(0),
+    }
+    path = str(tmp_path / "t.snap")
+    write_snapshot(path, arrays, {"name": "test"})
+    header, loaded = read_snapshot(path)
+    assert header["name"] == "test"
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        assert np.array_equal(loaded[name], array, equal_nan=True)
+        assert not len(array) or not loaded[name].flags.writeable
+
+def test_same_size_and_mtime_rewrite_is_stale(tmp_path):
+    source = tmp_path / "cases.json"
+    source.write_text("[1, 2, 3]")
+    header = {"source": source_info(str(source))}
+    assert is_current(header, str(source))
+    st = os.stat(source)
+    source.write_text("[1, 2, 4]")
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert not is_current(header, str(source))
+    # Touched without changes stays current
+    source.write_text("[1, 2, 3]")
+    assert is_current(header, str(source))
+
+def test_caches_rebuild_when_source_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_cases("cases.json", [10.0, 20.0])
+    exact, _ = load_lookup_tables("cases.json")
+    assert exact[(3, 93, 1.42)] == 10.0
+    assert os.path.exists(snapshot_path("cases.json"))
+    assert list(load_cases("cases.json").expected) == [10.0, 20.0]
+
+    st = os.stat("cases.json")
+    _write_cases("cases.json", [11.0, 20.0])
+    os.utime("cases.json", ns=(st.st_atime_ns, st.st_mtime_ns))
+    exact, _ = load_lookup_tables("cases.json")
+    assert exact[(3, 93, 1.42)] == 11.0
+    assert list(load_cases("cases.json").expected) == [11.0, 20.0]
+
+def test_unchanged_stamp_skips_hashing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(snapshot, "RACY_NS", 0)
+    with open("cases.json", "w") as f:
+        f.write("[1, 2, 3]")
+    header = {"source": source_info("cases.json")}
+
+    def no_hashing(path):
+        raise AssertionError("hashed an unchanged file")
+    monkeypatch.setattr(snapshot, "file_sha256", no_hashing)
+    assert is_current(header, "cases.json")
+    # A touched file is hashed once, then its digest is reused
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(snapshot, "RACY_NS", 0)
+    os.utime("cases.json")
+    assert is_current(header, "cases.json")
+    monkeypatch.setattr(snapshot, "file_sha256", no_hashing)
+    assert is_current(header, "cases.json")
+
+def test_unwritable_cache_builds_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_cases("cases.json", [10.0, 20.0])
+    with open(".cache", "w") as f:
+        f.write("not a directory")
+    exact, pattern = load_lookup_tables("cases.json")
+    assert exact[(3, 93, 1.42)] == 10.0 and len(pattern)
+    assert list(load_cases("cases.json").expected) == [10.0, 20.0]
@@ -1,31 +1,39 @@
-import json
-import matplotlib.pyplot as plt
-from run import calculate_reimbursement
-
-def load_cases():
-    with open("public_cases.json") as f:
-        return json.load(f)
-
-def main():
-    cases = load_cases()
-    xs, ys, zs = [], [], []
-    errors = []
-
-    for case in cases:
-        d = case["input"]["trip_duration_days"]
-        m = case["input"]["miles_traveled"]
-        r = case["input"]["total_receipts_amount"]
-        expected = case["expected_output"]
-        actual = calculate_reimbursement(d, m, r)
-        error = abs(actual - expected)
-
-        xs.append(d)
-        ys.append(m)
-        zs.append(r)
-        errors.append(error)
+import argparse
+import os
 
+import numpy as np
+
+import eval_cache
+from aggregate import group_stats
+from cases import load_cases
+from run import calculate_reimbursement_batch
+
+# Above this many cases, one marker per case is unreadable and slow; bin instead
+SCATTER_LIMIT = 100_000
+PREDICT_CHUNK = 1_000_000
+
+def load_predictions(cases, cases_path, predictions_path=None, use_cache=True):
+    """Predictions for every case: from a .npy file, the eval cache, or computed in chunks and cached."""
+    if predictions_path:
+        return np.load(predictions_path, mmap_mode="r")
+
+    key = eval_cache.fingerprint("run", cases_path) if use_cache else None
+    if key:
+        cached = eval_cache.load_predictions(key)
+        if cached is not None and len(cached) == len(cases):
+            print(f"♻️  Reusing cached predictions ({key[:12]})")
+            return cached
+
+    actual = np.empty(len(cases))
+    for lo in range(0, len(cases), PREDICT_CHUNK):
+        actual[lo:lo + PREDICT_CHUNK] = calculate_reimbursement_batch(*cases[lo:lo + PREDICT_CHUNK].columns())
+    if key:
+        eval_cache.save_predictions(key, actual, "run", cases_path)
+    return actual
+
+def scatter_plots(plt, xs, ys, zs, errors):
     # === Plot 1: Error vs Receipts ===
-    plt.figure(figsize=(10, 6))
+    fig1 = plt.figure(figsize=(10, 6))
     plt.scatter(zs, errors, alpha=0.5, color='red')
     plt.xlabel("Receipts ($)")
     plt.ylabel("Absolute Error")
@@ -33,7 +41,7 @@ def main():
     plt.grid(True)
 
     # === Plot 2: Error vs Miles ===
-    plt.figure(figsize=(10, 6))
+    fig2 = plt.figure(figsize=(10, 6))
     plt.scatter(ys, errors, alpha=0.5, color='blue')
     plt.xlabel("Miles Traveled")
     plt.ylabel("Absolute Error")
@@ -41,13 +49,107 @@ def main():
     plt.grid(True)
 
     # === Plot 3: Error vs Trip Duration ===
-    plt.figure(figsize=(10, 6))
+    fig3 = plt.figure(figsize=(10, 6))
     plt.scatter(xs, errors, alpha=0.5, color='green')
     plt.xlabel("Trip Duration (Days)")
     plt.ylabel("Absolute Error")
     plt.title("Error vs Trip Duration")
     plt.grid(True)
 
+    return [("error_vs_receipts", fig1), ("error_vs_miles", fig2), ("error_vs_days", fig3)]
+
+def _edges(values, bins, integer=False):
+    lo, hi = float(np.min(values)), float(np.max(values))
+    if integer and hi - lo < bins:
+        # One bin per whole value, e.g. trip days
+        return np.arange(lo - 0.5, hi + 1.5)
+    return np.linspace(lo, hi if hi > lo else lo + 1, bins + 1)
+
+def _cells(values, edges):
+    # Edges are evenly spaced, so the cell is plain arithmetic rather than a search
+    width = edges[1] - edges[0]
+    return np.clip(((values - edges[0]) / width).astype(np.int64), 0, len(edges) - 2)
+
+def density_plot(plt, x, errors, xlabel, title, bins=200, integer=False):
+    """2D histogram of (x, error) on a log colour scale, instead of one marker per case."""
+    from matplotlib.colors import LogNorm
+
+    xedges, yedges = _edges(x, bins, integer), _edges(errors, bins // 2)
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    counts = np.bincount(_cells(x, xedges) * ny + _cells(errors, yedges), minlength=nx * ny).reshape(nx, ny)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    mesh = ax.pcolormesh(xedges, yedges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap="viridis")
+    fig.colorbar(mesh, ax=ax, label="Cases")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Absolute Error")
+    ax.set_title(title)
+    ax.grid(True)
+    return fig
+
+def mean_error_grid(plt, x, y, errors, xlabel, ylabel, title, bins=100, x_integer=False):
+    """Mean absolute error per (x, y) cell; empty cells are left blank."""
+    xedges, yedges = _edges(x, bins, x_integer), _edges(y, bins)
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    stats = group_stats(_cells(x, xedges) * ny + _cells(y, yedges), nx * ny, np.asarray(errors, dtype=np.float64))
+    mean = stats["mean"].reshape(nx, ny)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    mesh = ax.pcolormesh(xedges, yedges, np.ma.masked_invalid(mean.T), cmap="magma")
+    fig.colorbar(mesh, ax=ax, label="Mean Absolute Error")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    return fig
+
+def binned_plots(plt, xs, ys, zs, errors):
+    return [
+        ("error_vs_receipts", density_plot(plt, zs, errors, "Receipts ($)", "Error vs Receipts Amount")),
+        ("error_vs_miles", density_plot(plt, ys, errors, "Miles Traveled", "Error vs Miles")),
+        ("error_vs_days", density_plot(plt, xs, errors, "Trip Duration (Days)", "Error vs Trip Duration",
+                                       integer=True)),
+        ("mean_error_miles_receipts", mean_error_grid(plt, ys, zs, errors, "Miles Traveled", "Receipts ($)",
+                                                      "Mean Error by Miles and Receipts")),
+        ("mean_error_days_receipts", mean_error_grid(plt, xs, zs, errors, "Trip Duration (Days)", "Receipts ($)",
+                                                     "Mean Error by Trip Duration and Receipts", x_integer=True)),
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot prediction errors against the inputs.")
+    parser.add_argument("--cases", default="public_cases.json", help="case file with expected outputs")
+    parser.add_argument("--predictions", metavar="NPY", help="reuse predictions saved with numpy.save")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the eval prediction cache")
+    parser.add_argument("--binned", action="store_true",
+                        help=f"density and mean-error grids instead of scatter plots (automatic above {SCATTER_LIMIT} cases)")
+    parser.add_argument("--out", metavar="DIR", help="write the figures to DIR without opening a window")
+    parser.add_argument("--format", choices=["png", "svg"], default="png", help="file format with --out")
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    if args.out:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    cases = load_cases(args.cases)
+    if not cases.has_expected:
+        print(f"❌ {args.cases} has no expected outputs to compare against")
+        return
+    xs, ys, zs = cases.columns()
+
+    actual = load_predictions(cases, args.cases, args.predictions, not args.no_cache)
+    errors = np.abs(actual - cases.expected)
+
+    if args.binned or len(cases) > SCATTER_LIMIT:
+        figures = binned_plots(plt, xs, ys, zs, errors)
+    else:
+        figures = scatter_plots(plt, xs, ys, zs, errors)
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for name, fig in figures:
+            fig.savefig(os.path.join(args.out, f"{name}.{args.format}"), dpi=120, bbox_inches="tight")
+            plt.close(fig)
+        print(f"✅ Saved {len(figures)} plots to {args.out}")
+        return
+
     # Show all
     plt.show()
 